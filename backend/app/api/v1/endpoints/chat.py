@@ -73,8 +73,10 @@ async def chat_stream(
     - **session_id**: 会话 ID（可选）
     
     返回 SSE 格式的流式响应：
+    - data: {"type": "status", "stage": "retrieving"} - 处理阶段状态
     - data: {"type": "chunk", "content": "..."}  - 内容片段
     - data: {"type": "sources", "sources": [...]} - 来源信息
+    - data: {"type": "sources_update", "sources": [...]} - 补充文档名称后的来源信息
     - data: {"type": "done"} - 完成标记
     """
     try:
@@ -3,6 +3,7 @@
 
 提供文档上传、列表、删除等接口。
 """
+import asyncio
 import os
 from typing import List
 
@@ -19,6 +20,7 @@ from app.schemas.document import (
     DocumentUpdate,
 )
 from app.services.doc_service import document_service
+from app.services.semantic_cache import semantic_cache
 from app.services.vector_service import vector_service
 from app.services.thumbnail_service import thumbnail_service
 
@@ -50,12 +52,14 @@ async def upload_document(
     4. 切分文本并向量化
     5. 存入向量数据库供检索
     """
-    # 读取文件内容
-    content = await file.read()
-    file_size = len(content)
+    # 获取文件大小并只读取文件头用于魔数验证，避免将整个文件读入内存
+    file.file.seek(0, os.SEEK_END)
+    file_size = file.file.tell()
+    file.file.seek(0)
+    header = file.file.read(document_service.SIGNATURE_READ_SIZE)
     
     # 验证文件（包括文件魔数验证）
-    is_valid, error_msg = document_service.validate_file(file.filename, file_size, content)
+    is_valid, error_msg = document_service.validate_file(file.filename, file_size, header)
     if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -64,7 +68,8 @@ async def upload_document(
     
     # 保存文件
     try:
-        filepath = document_service.save_file(file.filename, content)
+        # 大文件写盘耗时较长，放到线程池中执行，避免阻塞事件循环
+        filepath = await asyncio.to_thread(document_service.save_file, file.filename, file.file)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -115,30 +120,37 @@ def process_document_background(doc_id: int, filepath: str):
             DocumentUpdate(status="processing")
         )
         
-        # 提取文本（同步操作，但在线程池中执行不会阻塞主线程）
-        text, page_count = document_service.extract_text(filepath)
+        # 提取文本、切片与向量化流水线进行：向量化当前批次时，后台线程继续解析后续页面
+        batches, page_count = document_service.iter_chunk_batches(filepath)
+        chunk_count = 0
+        has_content = False
+        vector_error = None
         
-        if not text.strip():
-            raise ValueError("无法从文档中提取文本内容")
+        for batch in batches:
+            has_content = has_content or any(chunk["content"] for chunk in batch)
+            # 添加到向量数据库
+            if vector_error is None:
+                try:
+                    vector_service.add_documents(doc_id, batch, start_index=chunk_count)
+                except Exception as e:
+                    # 向量化失败但继续切片，以便记录切片数量
+                    vector_error = e
+            chunk_count += len(batch)
         
-        # 切分文本
-        chunks = document_service.chunk_text(text)
+        if not has_content:
+            raise ValueError("无法从文档中提取文本内容")
         
-        if not chunks:
-            raise ValueError("文本切片失败，未生成任何切片")
-        
-        # 添加到向量数据库
-        try:
-            vector_service.add_documents(doc_id, chunks)
-            print(f"✓ 文档 {doc_id} 处理完成，共 {len(chunks)} 个切片")
-        except Exception as e:
-            # 向量化失败但继续
-            print(f"⚠ 文档 {doc_id} 向量化失败: {e}")
+        if vector_error is None:
+            # 新文档会影响未限定文档的检索结果，清除相关缓存回答
+            semantic_cache.invalidate(doc_id)
+            print(f"✓ 文档 {doc_id} 处理完成，共 {chunk_count} 个切片")
+        else:
+            print(f"⚠ 文档 {doc_id} 向量化失败: {vector_error}")
         
         # 更新文档状态为已处理
         document_crud.update_document(
             db, doc_id,
-            DocumentUpdate(status="processed", chunk_count=len(chunks))
+            DocumentUpdate(status="processed", chunk_count=chunk_count)
         )
         
         # 生成缩略图（同步操作）
@@ -150,6 +162,13 @@ def process_document_background(doc_id: int, filepath: str):
         
     except Exception as e:
         print(f"✗ 文档 {doc_id} 后台处理异常: {e}")
+        # 流水线中途失败时已有批次写入了向量库，清除这些向量及可能引用它们的缓存回答，
+        # 避免未限定文档的检索继续返回失败文档的内容
+        try:
+            vector_service.delete_document_vectors(doc_id)
+            semantic_cache.invalidate(doc_id)
+        except Exception as cleanup_error:
+            print(f"⚠ 文档 {doc_id} 清理已写入的向量失败: {cleanup_error}")
         try:
             document_crud.update_document(
                 db, doc_id,
@@ -225,11 +244,14 @@ async def delete_document(
             detail=f"文档 ID {doc_id} 不存在"
         )
     
-    # 删除向量
-    vector_service.delete_document_vectors(doc_id)
+    # 删除向量（在线程池中执行，避免阻塞事件循环）
+    await asyncio.to_thread(vector_service.delete_document_vectors, doc_id)
+    
+    # 删除语义缓存中引用该文档的回答
+    semantic_cache.invalidate(doc_id)
     
     # 删除缩略图缓存
-    thumbnail_service.delete_thumbnail_cache(doc_id)
+    thumbnail_service.delete_thumbnail_cache(doc_id, db_document.filepath)
     
     # 删除文件
     document_service.delete_file(db_document.filepath)
@@ -340,7 +362,7 @@ async def get_document_thumbnail(
         )
     
     # 获取或生成缩略图
-    thumbnail_data = thumbnail_service.get_or_generate_thumbnail(
+    thumbnail_data = await thumbnail_service.get_or_generate_thumbnail_async(
         doc_id, 
         db_document.filepath
     )
@@ -130,6 +130,10 @@ async def update_llm_config(request: LLMConfigRequest) -> LLMConfigResponse:
     except Exception as e:
         print(f"⚠ 重新加载向量服务配置失败: {e}")
     
+    # 模型变更后旧的缓存回答不再适用
+    from app.services.semantic_cache import semantic_cache
+    semantic_cache.invalidate()
+    
     # 返回更新后的配置
     effective_config = get_effective_config()
     api_key = effective_config.get("api_key")
@@ -160,12 +164,9 @@ async def test_llm_connection():
         }
     
     try:
-        from openai import AsyncOpenAI
+        from app.services.chat_service import chat_service
         
-        client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=config.get("api_base") if config.get("api_base") else None
-        )
+        client = chat_service.get_llm_client(api_key, config.get("api_base"))
         
         # 发送简单的测试请求
         response = await client.chat.completions.create(
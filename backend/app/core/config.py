@@ -56,6 +56,7 @@ class Settings(BaseSettings):
     OPENAI_API_BASE: Optional[str] = Field(default=None, description="OpenAI API 基础URL")
     LLM_MODEL: str = Field(default="qwen3-max-preview", description="使用的LLM模型名称")
     EMBEDDING_MODEL: str = Field(default="Qwen/Qwen3-Embedding-8B", description="嵌入模型名称")
+    LLM_MAX_CONCURRENCY: int = Field(default=8, description="单进程内 LLM 并发请求上限")
     
     # 向量数据库配置
     CHROMA_PERSIST_DIRECTORY: str = Field(
@@ -66,6 +67,10 @@ class Settings(BaseSettings):
         default="documents", 
         description="ChromaDB 集合名称"
     )
+    CHROMA_ADD_BATCH_SIZE: int = Field(default=128, description="每次写入 ChromaDB 的最大切片数")
+    EMBED_CONCURRENCY: int = Field(default=8, description="同时进行的嵌入请求数上限")
+    EMBEDDING_CACHE_ENABLED: bool = Field(default=True, description="是否在本地持久化缓存切片向量")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = Field(default=100000, description="向量缓存最大条目数，超出时淘汰最久未使用的条目")
     
     # 文件上传配置
     UPLOAD_DIR: str = Field(default=str(DATA_DIR / "uploads"), description="文件上传目录")
@@ -79,9 +84,19 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = Field(default=1000, description="文本切片大小")
     CHUNK_OVERLAP: int = Field(default=200, description="文本切片重叠大小")
     
+    # 文档解析配置
+    DOC_INGEST_WORKERS: int = Field(default=0, description="文档解析进程数，0 表示 CPU 核数减 1")
+    DOC_INGEST_IO_SERIAL: bool = Field(default=False, description="是否在当前进程中串行解析文档（适合机械硬盘）")
+    PARSE_CACHE_MAX_BYTES: int = Field(default=256 * 1024 * 1024, description="PDF 解析缓存目录的最大容量(字节)")
+    
     # 检索配置
     TOP_K_RESULTS: int = Field(default=5, description="检索返回的Top-K结果数量")
     
+    # 语义缓存配置
+    SEMANTIC_CACHE_ENABLED: bool = Field(default=True, description="是否启用语义回答缓存")
+    SEMANTIC_CACHE_THRESHOLD: float = Field(default=0.95, description="语义缓存命中所需的最小余弦相似度")
+    SEMANTIC_CACHE_MAX_ENTRIES: int = Field(default=2000, description="语义缓存最大条目数")
+    
     # CORS 配置
     CORS_ORIGINS: List[str] = Field(
         default=[
@@ -6,6 +6,7 @@ CRUD 操作模块
 from app.crud.document import (
     create_document,
     get_document,
+    get_document_names,
     get_documents,
     update_document,
     delete_document,
@@ -14,6 +15,7 @@ from app.crud.document import (
 )
 from app.crud.chat import (
     create_chat_message,
+    create_chat_messages,
     get_chat_message,
     get_messages_by_session,
     delete_messages_by_session,
@@ -24,6 +26,7 @@ __all__ = [
     # 文档相关
     "create_document",
     "get_document",
+    "get_document_names",
     "get_documents",
     "update_document",
     "delete_document",
@@ -31,6 +34,7 @@ __all__ = [
     "get_processed_documents",
     # 聊天相关
     "create_chat_message",
+    "create_chat_messages",
     "get_chat_message",
     "get_messages_by_session",
     "delete_messages_by_session",
@@ -5,6 +5,7 @@
 """
 from typing import List, Optional
 
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from app.models.chat import ChatMessage
@@ -35,6 +36,37 @@ def create_chat_message(db: Session, message_data: ChatMessageCreate) -> ChatMes
     return db_message
 
 
+def create_chat_messages(db: Session, messages_data: List[ChatMessageCreate]) -> int:
+    """
+    批量创建聊天消息记录（单条 INSERT 语句 executemany，单次事务提交）
+    
+    不经过 ORM 对象的 flush，也不回读主键。
+    
+    Args:
+        db: 数据库会话
+        messages_data: 消息创建数据列表
+        
+    Returns:
+        int: 插入的消息数量
+    """
+    if not messages_data:
+        return 0
+    
+    rows = [
+        {
+            "session_id": message_data.session_id,
+            "role": message_data.role,
+            "content": message_data.content,
+            "doc_id": message_data.doc_id,
+            "sources": message_data.sources,
+        }
+        for message_data in messages_data
+    ]
+    db.execute(insert(ChatMessage), rows)
+    db.commit()
+    return len(rows)
+
+
 def get_chat_message(db: Session, message_id: int) -> Optional[ChatMessage]:
     """
     根据ID获取聊天消息
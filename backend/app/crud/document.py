@@ -3,7 +3,7 @@
 
 封装文档相关的数据库增删改查操作。
 """
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from sqlalchemy.orm import Session
 
@@ -48,6 +48,24 @@ def get_document(db: Session, doc_id: int) -> Optional[Document]:
     return db.query(Document).filter(Document.id == doc_id).first()
 
 
+def get_document_names(db: Session, doc_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    批量获取文档名称
+    
+    Args:
+        db: 数据库会话
+        doc_ids: 文档ID列表
+        
+    Returns:
+        Dict[int, str]: 文档ID到文件名的映射
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return {}
+    rows = db.query(Document.id, Document.filename).filter(Document.id.in_(doc_ids)).all()
+    return {doc_id: filename for doc_id, filename in rows}
+
+
 def get_documents(
     db: Session, 
     skip: int = 0, 
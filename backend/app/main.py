@@ -66,6 +66,12 @@ async def lifespan(app: FastAPI):
     
     # 关闭时执行
     print(" 正在关闭应用...")
+    from app.services.doc_service import document_service
+    document_service.shutdown()
+    from app.services.thumbnail_service import thumbnail_service
+    thumbnail_service.shutdown()
+    from app.services.chat_service import chat_service
+    await chat_service.aclose()
 
 
 # 创建 FastAPI 应用实例
@@ -227,9 +233,13 @@ async def health_check():
 
 # 直接运行时启动服务器（支持右键直接运行 + 热更新）
 if __name__ == "__main__":
+    import multiprocessing
     import signal
     import uvicorn
     
+    # 打包环境下文档解析进程池的子进程需要此调用
+    multiprocessing.freeze_support()
+    
     # 确保工作目录正确
     # 在打包环境下，不切换到 backend 目录，使用当前目录
     if not getattr(sys, 'frozen', False):
@@ -3,19 +3,53 @@
 
 处理问答对话、Prompt 组装和 LLM 调用。
 """
-import json
+import asyncio
+import io
 import re
-import uuid
+import secrets
 from typing import AsyncGenerator, Dict, List, Optional, Tuple
 
+import orjson
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.crud import chat as chat_crud
+from app.crud import document as document_crud
+from app.db.session import SessionLocal
 from app.schemas.chat import ChatMessageCreate, ChatRequest, ChatResponse, SourceInfo, TokenUsage
+from app.services.semantic_cache import CacheEntry, question_key, semantic_cache
 from app.services.vector_service import vector_service
 
 
+# tiktoken 编码器（懒加载；加载失败时为 False，回退到按字符估算）
+_token_encoder = None
+
+
+def _count_tokens(text: str) -> int:
+    """
+    统计文本的 token 数
+    
+    优先使用 tiktoken 的 cl100k_base 编码；tiktoken 不可用或编码表无法加载
+    （例如离线环境）时，按每 4 个字符约 1 个 token 估算。
+    
+    Args:
+        text: 待统计的文本
+        
+    Returns:
+        int: token 数
+    """
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoder = False
+    if _token_encoder:
+        return len(_token_encoder.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
 class ChatService:
     """
     聊天服务类
@@ -37,6 +71,13 @@ class ChatService:
         r"^(这|它|该).*(讲|说|是|写).*?(什么|啥)",
     ]
     
+    # 合并为单个预编译正则，判断时只需一次匹配
+    OVERVIEW_REGEX = re.compile("|".join(f"(?:{p})" for p in OVERVIEW_PATTERNS), re.IGNORECASE)
+    
+    # 短问题中表示概览意图的关键词
+    SHORT_OVERVIEW_KEYWORDS = ["什么", "啥", "哪些", "介绍", "概述", "总结", "讲了", "说了", "关于"]
+    SHORT_OVERVIEW_REGEX = re.compile("|".join(re.escape(kw) for kw in SHORT_OVERVIEW_KEYWORDS))
+    
     # 系统提示词模板
     SYSTEM_PROMPT = """你是一个专业的文档问答助手。你的任务是根据提供的文档内容来回答用户的问题。
 
@@ -51,9 +92,86 @@ class ChatService:
 {context}
 """
     
+    # 预先拆分系统提示词模板，构建时直接拼接上下文，无需每次解析模板
+    _SYSTEM_PROMPT_PREFIX, _SYSTEM_PROMPT_SUFFIX = SYSTEM_PROMPT.split("{context}")
+    
+    # 未检索到上下文时的系统提示词
+    NO_CONTEXT_PROMPT = "你是一个文档问答助手。当前没有找到相关的文档内容，请告知用户可能需要先上传文档或调整问题。"
+    
+    # LLM 调用失败时回答的前缀（此类回答不写入语义缓存）
+    LLM_ERROR_PREFIX = "调用 LLM 时发生错误"
+    # 流式调用出错时随错误信息一起产出的标记（代替 Token 用量），
+    # 已输出部分回答后才出错时，回答不以错误前缀开头，需靠该标记识别
+    LLM_STREAM_ERROR: Dict = {"error": True}
+    
+    # 缓存回答回放时每个片段的字符数
+    REPLAY_CHUNK_SIZE = 16
+    
+    # 来源预览文本的最大字符数
+    PREVIEW_LENGTH = 200
+    
     def __init__(self):
         """初始化聊天服务"""
         self._llm_client = None
+        self._llm_client_key: Optional[Tuple[str, Optional[str]]] = None
+        self._http_client = None
+        self._llm_semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _get_llm_semaphore(self) -> asyncio.Semaphore:
+        """
+        获取限制 LLM 并发请求数的信号量（懒加载，需在事件循环中创建）
+        
+        Returns:
+            asyncio.Semaphore: 进程内共享的信号量
+        """
+        if self._llm_semaphore is None:
+            self._llm_semaphore = asyncio.Semaphore(max(1, settings.LLM_MAX_CONCURRENCY))
+        return self._llm_semaphore
+    
+    def get_llm_client(self, api_key: str, api_base: Optional[str]):
+        """
+        获取复用的 AsyncOpenAI 客户端（懒加载）
+        
+        所有客户端共享同一个 HTTP 连接池，流式请求无需每次重新建立 TLS 连接；
+        API Key 或 Base URL 变更时才创建新的客户端。
+        
+        Args:
+            api_key: API 密钥
+            api_base: API 基础URL
+            
+        Returns:
+            AsyncOpenAI: 客户端实例
+        """
+        key = (api_key, api_base or None)
+        if self._llm_client is None or self._llm_client_key != key:
+            import httpx
+            from openai import AsyncOpenAI
+            
+            if self._http_client is None:
+                concurrency = max(1, settings.LLM_MAX_CONCURRENCY)
+                self._http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_keepalive_connections=concurrency,
+                        max_connections=concurrency * 2
+                    ),
+                    timeout=httpx.Timeout(600.0, connect=5.0),
+                    follow_redirects=True
+                )
+            self._llm_client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=api_base if api_base else None,
+                http_client=self._http_client
+            )
+            self._llm_client_key = key
+        return self._llm_client
+    
+    async def aclose(self) -> None:
+        """关闭共享的 HTTP 连接池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        self._llm_client = None
+        self._llm_client_key = None
     
     def generate_session_id(self) -> str:
         """
@@ -62,7 +180,8 @@ class ChatService:
         Returns:
             str: 唯一的会话标识符
         """
-        return str(uuid.uuid4())[:8]
+        # 与原先 uuid4 前 8 位的格式一致（8 位十六进制）
+        return secrets.token_hex(4)
     
     def _is_overview_question(self, question: str) -> bool:
         """
@@ -74,67 +193,79 @@ class ChatService:
         Returns:
             bool: 是否为概览性问题
         """
-        question_lower = question.lower().strip()
-        
-        for pattern in self.OVERVIEW_PATTERNS:
-            if re.search(pattern, question_lower, re.IGNORECASE):
-                return True
+        if self.OVERVIEW_REGEX.search(question.strip()):
+            return True
         
         # 短问题且包含特定词汇
-        if len(question) < 20:
-            short_keywords = ["什么", "啥", "哪些", "介绍", "概述", "总结", "讲了", "说了", "关于"]
-            for kw in short_keywords:
-                if kw in question:
-                    return True
+        return len(question) < 20 and self.SHORT_OVERVIEW_REGEX.search(question) is not None
+    
+    def _truncate_preview(self, text: str) -> str:
+        """
+        截断来源预览文本
+        
+        超出长度时尽量在空白处截断，避免截断英文单词。
         
-        return False
+        Args:
+            text: 原始文本
+            
+        Returns:
+            str: 预览文本
+        """
+        limit = self.PREVIEW_LENGTH
+        if len(text) <= limit:
+            return text
+        cut = text.rfind(" ", limit - 20, limit)
+        return text[:cut if cut > 0 else limit] + "..."
     
-    def _build_context(self, search_results: List[dict], first_page_content: Optional[str] = None) -> Tuple[str, List[SourceInfo]]:
+    def _build_context(self, search_results: List[dict], first_page_content: Optional[str] = None) -> Tuple[str, List[dict]]:
         """
         根据检索结果构建上下文
         
+        来源信息直接构建为与 SourceInfo.model_dump(by_alias=True) 相同结构的字典，
+        可直接用于 SSE 推送和数据库存储，无需再经过 Pydantic 序列化。
+        
         Args:
             search_results: 向量搜索结果
             
         Returns:
-            Tuple[str, List[SourceInfo]]: (上下文文本, 来源信息列表)
+            Tuple[str, List[dict]]: (上下文文本, 来源信息字典列表)
         """
         if not search_results:
             return "", []
         
-        context_parts = []
-        sources = []
-        
-        for i, result in enumerate(search_results, start=1):
-            content = result["content"]
-            page = result.get("page", 1)
-            doc_id = result.get("doc_id")
-            score = result.get("score", 0)
-            
-            context_parts.append(f"[片段{i}，第{page}页]\n{content}")
-            sources.append(SourceInfo(
-                document_id=doc_id,
-                document_name=None,  # 可以后续从数据库查询
-                page=page,
-                chunk_text=content[:200] + "..." if len(content) > 200 else content,
-                similarity_score=score
-            ))
-        
-        context = "\n\n---\n\n".join(context_parts)
+        # 单次遍历直接写入缓冲区，避免先构建片段列表再拼接，以及概述前缀的二次拷贝
+        buffer = io.StringIO()
+        sources_data = []
         
         # 如果提供了第一页内容，添加到上下文开头
         if first_page_content:
-            context = f"[文档概述 - 第1页]\n{first_page_content}\n\n===== 相关片段 =====\n\n{context}"
+            buffer.write(f"[文档概述 - 第1页]\n{first_page_content}\n\n===== 相关片段 =====\n\n")
             # 添加第一页作为来源
-            sources.insert(0, SourceInfo(
-                document_id=search_results[0].get("doc_id") if search_results else None,
-                document_name=None,
-                page=1,
-                chunk_text=first_page_content[:200] + "..." if len(first_page_content) > 200 else first_page_content,
-                similarity_score=1.0  # 概述内容给最高分
-            ))
+            sources_data.append({
+                "document_id": search_results[0].get("doc_id"),
+                "document_name": None,
+                "page": 1,
+                "chunk_text": self._truncate_preview(first_page_content),
+                "similarity_score": 1.0  # 概述内容给最高分
+            })
         
-        return context, sources
+        for i, result in enumerate(search_results, start=1):
+            content = result["content"]
+            page = result.get("page", 1)
+            
+            if i > 1:
+                buffer.write("\n\n---\n\n")
+            buffer.write(f"[片段{i}，第{page}页]\n")
+            buffer.write(content)
+            sources_data.append({
+                "document_id": result.get("doc_id"),
+                "document_name": None,  # 流式接口中由 _enrich_source_names 补充
+                "page": page,
+                "chunk_text": self._truncate_preview(content),
+                "similarity_score": result.get("score", 0)
+            })
+        
+        return buffer.getvalue(), sources_data
     
     def _build_prompt(self, context: str, question: str) -> List[dict]:
         """
@@ -147,9 +278,10 @@ class ChatService:
         Returns:
             List[dict]: OpenAI 格式的消息列表
         """
-        system_message = self.SYSTEM_PROMPT.format(context=context) if context else (
-            "你是一个文档问答助手。当前没有找到相关的文档内容，请告知用户可能需要先上传文档或调整问题。"
-        )
+        if context:
+            system_message = "".join((self._SYSTEM_PROMPT_PREFIX, context, self._SYSTEM_PROMPT_SUFFIX))
+        else:
+            system_message = self.NO_CONTEXT_PROMPT
         
         messages = [
             {"role": "system", "content": system_message},
@@ -158,6 +290,18 @@ class ChatService:
         
         return messages
     
+    def _count_prompt_tokens(self, messages: List[dict]) -> int:
+        """
+        统计对话消息的 token 数（仅统计消息内容）
+        
+        Args:
+            messages: 对话消息列表
+            
+        Returns:
+            int: token 数
+        """
+        return sum(_count_tokens(msg["content"]) for msg in messages)
+    
     def _get_llm_config(self) -> dict:
         """
         获取有效的 LLM 配置
@@ -189,27 +333,26 @@ class ChatService:
             # 返回模拟回答，用于测试
             mock_response = self._generate_mock_response(messages)
             # 模拟 token 用量（粗略估算）
+            prompt_tokens = self._count_prompt_tokens(messages)
+            completion_tokens = _count_tokens(mock_response)
             mock_usage = TokenUsage(
-                prompt_tokens=len(str(messages)) // 4,
-                completion_tokens=len(mock_response) // 4,
-                total_tokens=(len(str(messages)) + len(mock_response)) // 4
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
             )
             return mock_response, mock_usage
         
         try:
-            from openai import AsyncOpenAI
+            client = self.get_llm_client(api_key, api_base)
             
-            client = AsyncOpenAI(
-                api_key=api_key,
-                base_url=api_base if api_base else None
-            )
-            
-            response = await client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            # 限制并发请求数，避免触发上游限流
+            async with self._get_llm_semaphore():
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
             
             # 提取 token 用量
             usage = None
@@ -223,7 +366,7 @@ class ChatService:
             return response.choices[0].message.content, usage
             
         except Exception as e:
-            return f"调用 LLM 时发生错误: {str(e)}", None
+            return f"{self.LLM_ERROR_PREFIX}: {str(e)}", None
     
     async def _call_llm_stream(self, messages: List[dict]) -> AsyncGenerator[Tuple[str, Optional[Dict]], None]:
         """
@@ -233,7 +376,8 @@ class ChatService:
             messages: 对话消息列表
             
         Yields:
-            Tuple[str, Optional[Dict]]: (回答片段, Token用量) - usage 只在最后一次 yield 中有值
+            Tuple[str, Optional[Dict]]: (回答片段, Token用量) - usage 只在最后一次 yield 中有值；
+                调用失败时最后产出 (错误信息, LLM_STREAM_ERROR)
         """
         # 获取动态配置
         config = self._get_llm_config()
@@ -243,51 +387,252 @@ class ChatService:
         
         if not api_key or api_key == "your_api_key_here":
             # 返回模拟回答，用于测试
+            prompt_tokens = self._count_prompt_tokens(messages)
             mock_response = self._generate_mock_response(messages)
             for char in mock_response:
                 yield char, None
             # 最后 yield 模拟的 token 用量
+            completion_tokens = _count_tokens(mock_response)
             mock_usage = {
-                "prompt_tokens": len(str(messages)) // 4,
-                "completion_tokens": len(mock_response) // 4,
-                "total_tokens": (len(str(messages)) + len(mock_response)) // 4
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
             }
             yield "", mock_usage
             return
         
         try:
-            from openai import AsyncOpenAI
-            
-            client = AsyncOpenAI(
-                api_key=api_key,
-                base_url=api_base if api_base else None
-            )
+            client = self.get_llm_client(api_key, api_base)
             
-            stream = await client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000,
-                stream=True,
-                stream_options={"include_usage": True}
-            )
-            
-            async for chunk in stream:
-                # 内容片段
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content, None
+            # 限制并发请求数；流读取完毕（或客户端断开）后才释放
+            async with self._get_llm_semaphore():
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1000,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
                 
-                # 最后一个 chunk 包含 usage
-                if hasattr(chunk, 'usage') and chunk.usage:
-                    usage = {
-                        "prompt_tokens": chunk.usage.prompt_tokens,
-                        "completion_tokens": chunk.usage.completion_tokens,
-                        "total_tokens": chunk.usage.total_tokens
-                    }
-                    yield "", usage
+                async for chunk in stream:
+                    # 内容片段
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content, None
                     
+                    # 最后一个 chunk 包含 usage
+                    if hasattr(chunk, 'usage') and chunk.usage:
+                        usage = {
+                            "prompt_tokens": chunk.usage.prompt_tokens,
+                            "completion_tokens": chunk.usage.completion_tokens,
+                            "total_tokens": chunk.usage.total_tokens
+                        }
+                        yield "", usage
+                    
+        except Exception as e:
+            yield f"{self.LLM_ERROR_PREFIX}: {str(e)}", self.LLM_STREAM_ERROR
+    
+    def _embed_question(self, question: str) -> Optional[List[float]]:
+        """
+        计算问题向量（用于语义缓存和检索）
+        
+        Args:
+            question: 用户问题
+            
+        Returns:
+            Optional[List[float]]: 问题向量，未启用缓存或向量化失败时返回 None
+        """
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return None
+        try:
+            return vector_service.embed_query(question)
         except Exception as e:
-            yield f"调用 LLM 时发生错误: {str(e)}", None
+            print(f"⚠ 问题向量化失败，跳过语义缓存: {e}")
+            return None
+    
+    def _cache_scope(self, doc_ids: Optional[List[int]]) -> Optional[Tuple[int, ...]]:
+        """将文档ID列表转换为语义缓存作用域"""
+        return tuple(sorted(set(doc_ids))) if doc_ids else None
+    
+    def _lookup_exact_cache(self, doc_ids: Optional[List[int]], key: bytes) -> Optional[CacheEntry]:
+        """
+        按规范化问题精确查找缓存回答（无需计算问题向量）
+        
+        Args:
+            doc_ids: 文档ID列表
+            key: 问题哈希
+            
+        Returns:
+            Optional[CacheEntry]: 命中的缓存条目
+        """
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return None
+        return semantic_cache.lookup_exact(self._cache_scope(doc_ids), key)
+    
+    def _lookup_cache(self, doc_ids: Optional[List[int]], query_embedding: Optional[List[float]]) -> Optional[CacheEntry]:
+        """
+        在语义缓存中查找相似问题的回答
+        
+        Args:
+            doc_ids: 文档ID列表
+            query_embedding: 问题向量
+            
+        Returns:
+            Optional[CacheEntry]: 命中的缓存条目
+        """
+        if query_embedding is None:
+            return None
+        return semantic_cache.lookup(self._cache_scope(doc_ids), query_embedding)
+    
+    def _store_cache(
+        self,
+        doc_ids: Optional[List[int]],
+        query_embedding: Optional[List[float]],
+        answer: str,
+        sources_data: List[dict],
+        usage: Optional[dict],
+        key: Optional[bytes] = None
+    ) -> None:
+        """
+        将新生成的回答写入语义缓存
+        
+        Args:
+            doc_ids: 文档ID列表
+            query_embedding: 问题向量
+            answer: LLM 回答
+            sources_data: 来源信息字典列表
+            usage: Token 用量
+            key: 问题哈希
+        """
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return
+        if not answer or answer.startswith(self.LLM_ERROR_PREFIX):
+            return
+        semantic_cache.insert(self._cache_scope(doc_ids), query_embedding, answer, sources_data, usage, key)
+    
+    async def _retrieve(
+        self,
+        question: str,
+        doc_ids: Optional[List[int]],
+        top_k: int,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[dict]:
+        """
+        在一个或多个文档中检索相关片段
+        
+        多个文档时以 doc_id $in 过滤一次检索，直接得到全局 Top-K。
+        
+        Args:
+            question: 用户问题
+            doc_ids: 文档ID列表，为空时检索所有文档
+            top_k: 返回的结果数量
+            query_embedding: 预先计算好的问题向量
+            
+        Returns:
+            List[dict]: 按相似度降序排列的检索结果
+        """
+        return await asyncio.to_thread(
+            vector_service.search,
+            question,
+            doc_ids or None,
+            top_k,
+            query_embedding
+        )
+    
+    def _save_turn(
+        self,
+        db: Session,
+        session_id: str,
+        doc_id: Optional[int],
+        question: str,
+        answer: str,
+        sources_data: List[dict]
+    ) -> None:
+        """
+        保存一轮问答到数据库
+        
+        Args:
+            db: 数据库会话
+            session_id: 会话ID
+            doc_id: 关联的文档ID
+            question: 用户问题
+            answer: AI 回答
+            sources_data: 来源信息字典列表
+        """
+        chat_crud.create_chat_messages(db, [
+            ChatMessageCreate(
+                session_id=session_id,
+                role="user",
+                content=question,
+                doc_id=doc_id
+            ),
+            ChatMessageCreate(
+                session_id=session_id,
+                role="assistant",
+                content=answer,
+                doc_id=doc_id,
+                sources=orjson.dumps(sources_data).decode() if sources_data else None
+            ),
+        ])
+    
+    @staticmethod
+    def _sse(payload: dict) -> bytes:
+        """
+        将数据编码为一帧 SSE 消息
+        
+        Args:
+            payload: 消息内容
+            
+        Returns:
+            bytes: UTF-8 编码的 SSE 数据帧
+        """
+        return b"data: " + orjson.dumps(payload) + b"\n\n"
+    
+    def _enrich_source_names(self, sources_data: List[dict]) -> Optional[List[dict]]:
+        """
+        从数据库查询并填充来源的文档名称
+        
+        在工作线程中与流式生成并行执行，因此使用独立的短期会话，不与请求会话共享。
+        
+        Args:
+            sources_data: 来源信息字典列表
+            
+        Returns:
+            Optional[List[dict]]: 填充名称后的来源列表，无需更新或查询失败时返回 None
+        """
+        doc_ids = {s.get("document_id") for s in sources_data if s.get("document_id") is not None}
+        if not doc_ids:
+            return None
+        db = SessionLocal()
+        try:
+            names = document_crud.get_document_names(db, doc_ids)
+        except Exception as e:
+            print(f"⚠ 查询来源文档名称失败: {e}")
+            return None
+        finally:
+            db.close()
+        if not names:
+            return None
+        return [
+            {**s, "document_name": names.get(s.get("document_id"), s.get("document_name"))}
+            for s in sources_data
+        ]
+    
+    async def _replay_cached_stream(self, entry: CacheEntry) -> AsyncGenerator[Tuple[str, Optional[Dict]], None]:
+        """
+        以流式片段的形式回放缓存的回答
+        
+        Args:
+            entry: 缓存条目
+            
+        Yields:
+            Tuple[str, Optional[Dict]]: 与 _call_llm_stream 相同格式的 (回答片段, Token用量)
+        """
+        answer = entry.answer
+        for i in range(0, len(answer), self.REPLAY_CHUNK_SIZE):
+            yield answer[i:i + self.REPLAY_CHUNK_SIZE], None
+        if entry.usage:
+            yield "", entry.usage
     
     def _generate_mock_response(self, messages: List[dict]) -> str:
         """
@@ -354,62 +699,63 @@ class ChatService:
         doc_ids = request.get_doc_ids
         
         # --- 步骤 1: 检索 (Retrieve) ---
-        # 在向量数据库中检索相关内容
-        # 如果有多个文档ID，取第一个进行检索（待优化为多文档检索）
+        # 在向量数据库中检索相关内容，多个文档时并发检索后合并
+        # 对话记录和概览内容关联第一个文档
         doc_id = doc_ids[0] if doc_ids else None
         top_k = request.top_k or settings.TOP_K_RESULTS
         
-        search_results = vector_service.search(
-            query=question,
-            doc_id=doc_id,
-            top_k=top_k
-        )
-        
-        # --- 步骤 2: 增强 (Augment) ---
-        # 智能判断：如果是概览性问题，额外获取第一页内容
-        first_page_content = None
-        if doc_id and self._is_overview_question(question):
-            first_page_content = vector_service.get_first_page_chunks(doc_id)
-        
-        # 构建上下文和来源信息
-        # 将检索到的零散片段整理成 LLM 能读懂的上下文文本
-        context, sources = self._build_context(search_results, first_page_content)
-        
-        # 构建 Prompt
-        # 组合系统提示词、上下文和用户问题
-        messages = self._build_prompt(context, question)
-        
-        # --- 步骤 3: 生成 (Generate) ---
-        # 调用 LLM 获取回答
-        answer, usage = await self._call_llm(messages)
-        
-        # --- 步骤 4: 记录 ---
-        # 保存用户消息到数据库
-        chat_crud.create_chat_message(
-            db,
-            ChatMessageCreate(
-                session_id=session_id,
-                role="user",
-                content=question,
-                doc_id=doc_id
+        # 语义缓存：相同或相似问题直接复用已有回答，跳过检索和 LLM 调用
+        # 先按规范化问题精确匹配，未命中再计算问题向量做相似度匹配
+        cache_key = question_key(question)
+        query_embedding = None
+        cached = self._lookup_exact_cache(doc_ids, cache_key)
+        if cached is None:
+            query_embedding = await asyncio.to_thread(self._embed_question, question)
+            cached = self._lookup_cache(doc_ids, query_embedding)
+        
+        if cached is not None:
+            answer = cached.answer
+            sources_data = cached.sources
+            usage = TokenUsage(**cached.usage) if cached.usage else None
+        else:
+            search_results = await self._retrieve(question, doc_ids, top_k, query_embedding)
+            
+            # --- 步骤 2: 增强 (Augment) ---
+            # 智能判断：如果是概览性问题，额外获取第一页内容
+            first_page_content = None
+            if doc_id and self._is_overview_question(question):
+                first_page_content = await asyncio.to_thread(vector_service.get_first_page_chunks, doc_id)
+            
+            # 构建上下文和来源信息
+            # 将检索到的零散片段整理成 LLM 能读懂的上下文文本
+            context, sources_data = self._build_context(search_results, first_page_content)
+            
+            # 构建 Prompt
+            # 组合系统提示词、上下文和用户问题
+            messages = self._build_prompt(context, question)
+            
+            # --- 步骤 3: 生成 (Generate) ---
+            # 调用 LLM 获取回答
+            answer, usage = await self._call_llm(messages)
+            
+            self._store_cache(
+                doc_ids,
+                query_embedding,
+                answer,
+                sources_data,
+                usage.model_dump() if usage else None,
+                cache_key
             )
-        )
         
-        # 保存 AI 回答到数据库
-        chat_crud.create_chat_message(
-            db,
-            ChatMessageCreate(
-                session_id=session_id,
-                role="assistant",
-                content=answer,
-                doc_id=doc_id,
-                sources=json.dumps([s.model_dump(by_alias=True) for s in sources], ensure_ascii=False) if sources else None
-            )
+        # --- 步骤 4: 记录 ---
+        # 在同一事务中保存用户消息和 AI 回答
+        await asyncio.to_thread(
+            self._save_turn, db, session_id, doc_id, question, answer, sources_data
         )
         
         return ChatResponse(
             answer=answer,
-            sources=sources,
+            sources=[SourceInfo(**d) for d in sources_data],
             session_id=session_id,
             query=question,
             usage=usage
@@ -419,7 +765,7 @@ class ChatService:
         self, 
         db: Session, 
         request: ChatRequest
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         流式处理用户提问并返回回答 (RAG 核心流程)
         
@@ -428,81 +774,103 @@ class ChatService:
             request: 聊天请求
             
         Yields:
-            str: SSE 格式的响应数据
+            bytes: SSE 格式的响应数据
         """
         # 获取问题内容
         question = request.get_question
         if not question:
-            yield f"data: {json.dumps({'type': 'error', 'message': '请提供一个问题'}, ensure_ascii=False)}\n\n"
+            yield self._sse({'type': 'error', 'message': '请提供一个问题'})
             return
         
         # 确定会话ID
         session_id = request.session_id or self.generate_session_id()
         
+        # 立即发送状态帧，让客户端在检索期间即可收到首字节
+        yield self._sse({'type': 'status', 'stage': 'retrieving', 'session_id': session_id})
+        
         # 获取文档ID列表
         doc_ids = request.get_doc_ids
         doc_id = doc_ids[0] if doc_ids else None
         top_k = request.top_k or settings.TOP_K_RESULTS
         
-        # --- 步骤 1: 检索 (Retrieve) ---
-        search_results = vector_service.search(
-            query=question,
-            doc_id=doc_id,
-            top_k=top_k
-        )
-        
-        # --- 步骤 2: 增强 (Augment) ---
-        # 智能判断：如果是概览性问题，额外获取第一页内容
-        first_page_content = None
-        if doc_id and self._is_overview_question(question):
-            first_page_content = vector_service.get_first_page_chunks(doc_id)
-        
-        context, sources = self._build_context(search_results, first_page_content)
-        messages = self._build_prompt(context, question)
+        # 语义缓存：命中时回放已有回答，跳过检索和 LLM 调用
+        # 先按规范化问题精确匹配，未命中再计算问题向量做相似度匹配
+        cache_key = question_key(question)
+        query_embedding = None
+        cached = self._lookup_exact_cache(doc_ids, cache_key)
+        if cached is None:
+            query_embedding = await asyncio.to_thread(self._embed_question, question)
+            cached = self._lookup_cache(doc_ids, query_embedding)
+        
+        if cached is not None:
+            sources_data = cached.sources
+            answer_stream = self._replay_cached_stream(cached)
+        else:
+            # --- 步骤 1: 检索 (Retrieve) ---
+            search_results = await self._retrieve(question, doc_ids, top_k, query_embedding)
+            
+            # --- 步骤 2: 增强 (Augment) ---
+            # 智能判断：如果是概览性问题，额外获取第一页内容
+            first_page_content = None
+            if doc_id and self._is_overview_question(question):
+                first_page_content = await asyncio.to_thread(vector_service.get_first_page_chunks, doc_id)
+            
+            context, sources_data = self._build_context(search_results, first_page_content)
+            messages = self._build_prompt(context, question)
+            answer_stream = self._call_llm_stream(messages)
         
         # 发送来源信息
-        sources_data = [s.model_dump(by_alias=True) for s in sources]
-        yield f"data: {json.dumps({'type': 'sources', 'sources': sources_data, 'session_id': session_id}, ensure_ascii=False)}\n\n"
+        yield self._sse({'type': 'sources', 'sources': sources_data, 'session_id': session_id})
+        
+        # 在后台查询来源文档名称，与 LLM 生成并行，完成后通过 sources_update 补发
+        # 缓存命中时来源通常已包含名称，但非流式接口写入的缓存条目没有名称，同样需要补充
+        names_task = None
+        if any(source.get("document_name") is None for source in sources_data):
+            names_task = asyncio.create_task(asyncio.to_thread(self._enrich_source_names, sources_data))
         
         # --- 步骤 3: 流式生成 (Generate) ---
-        full_answer = ""
+        # 收集回答片段，结束后一次拼接，避免逐片段拼接字符串
+        answer_parts = []
         final_usage = None
-        async for chunk, usage in self._call_llm_stream(messages):
+        stream_failed = False
+        async for chunk, usage in answer_stream:
             if chunk:
-                full_answer += chunk
-                yield f"data: {json.dumps({'type': 'chunk', 'content': chunk}, ensure_ascii=False)}\n\n"
-            if usage:
+                answer_parts.append(chunk)
+                yield self._sse({'type': 'chunk', 'content': chunk})
+            if usage is self.LLM_STREAM_ERROR:
+                stream_failed = True
+            elif usage:
                 final_usage = usage
+            if names_task is not None and names_task.done():
+                enriched = names_task.result()
+                names_task = None
+                if enriched:
+                    sources_data = enriched
+                    yield self._sse({'type': 'sources_update', 'sources': sources_data})
         
-        # --- 步骤 4: 记录 ---
-        # 保存用户消息到数据库
-        chat_crud.create_chat_message(
-            db,
-            ChatMessageCreate(
-                session_id=session_id,
-                role="user",
-                content=question,
-                doc_id=doc_id
-            )
-        )
+        if names_task is not None:
+            enriched = await names_task
+            if enriched:
+                sources_data = enriched
+                yield self._sse({'type': 'sources_update', 'sources': sources_data})
         
-        # 保存 AI 回答到数据库
-        chat_crud.create_chat_message(
-            db,
-            ChatMessageCreate(
-                session_id=session_id,
-                role="assistant",
-                content=full_answer,
-                doc_id=doc_id,
-                sources=json.dumps(sources_data, ensure_ascii=False) if sources else None
-            )
+        full_answer = "".join(answer_parts)
+        
+        # 生成中途出错的回答不完整，不写入缓存
+        if cached is None and not stream_failed:
+            self._store_cache(doc_ids, query_embedding, full_answer, sources_data, final_usage, cache_key)
+        
+        # --- 步骤 4: 记录 ---
+        # 在同一事务中保存用户消息和 AI 回答
+        await asyncio.to_thread(
+            self._save_turn, db, session_id, doc_id, question, full_answer, sources_data
         )
         
         # 发送完成标记（包含 token 用量）
         done_data = {'type': 'done'}
         if final_usage:
             done_data['usage'] = final_usage
-        yield f"data: {json.dumps(done_data, ensure_ascii=False)}\n\n"
+        yield self._sse(done_data)
 
 
 # 创建全局服务实例
@@ -3,19 +3,78 @@
 
 处理文档上传、存储、文本提取和切片等业务逻辑。
 """
+import hashlib
+import mmap
+import multiprocessing
 import os
+import queue
+import re
 import shutil
-from datetime import datetime
-from typing import List, Optional, Tuple
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 
+import orjson
 from pypdf import PdfReader
 from docx import Document as DocxDocument
-from sqlalchemy.orm import Session
+
+try:
+    import fitz  # PyMuPDF，C 实现的 PDF 解析，比 pypdf 快数倍
+except ImportError:
+    fitz = None
 
 from app.core.config import settings
-from app.crud import document as document_crud
-from app.models.document import Document
-from app.schemas.document import DocumentCreate, DocumentUpdate
+
+
+# 编码识别时依次尝试的候选编码（未安装 charset-normalizer 时使用）
+_FALLBACK_ENCODINGS = ('utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1')
+
+# charset-normalizer 识别编码时采样的字节数
+_DETECT_SAMPLE_SIZE = 1 << 20
+
+
+def _decode_text(raw: Union[bytes, mmap.mmap]) -> Tuple[str, str]:
+    """
+    识别文本字节的编码并解码
+    
+    优先检查 BOM，其次尝试 UTF-8，再使用 charset-normalizer 识别，
+    未安装时依次尝试候选编码。识别成功的那次解码结果直接返回，不会再次解码全文。
+    
+    Args:
+        raw: 文件原始字节（bytes 或内存映射）
+        
+    Returns:
+        Tuple[str, str]: (编码名称, 解码后的文本)
+    """
+    if raw[:3] == b'\xef\xbb\xbf':
+        return 'utf-8', str(raw, 'utf-8', 'replace')
+    if raw[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return 'utf-16', str(raw, 'utf-16', 'replace')
+    
+    try:
+        return 'utf-8', str(raw, 'utf-8')
+    except UnicodeDecodeError:
+        pass
+    
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(bytes(raw[:_DETECT_SAMPLE_SIZE])).best()
+        if best is not None:
+            return best.encoding, str(raw, best.encoding, 'replace')
+    except ImportError:
+        pass
+    
+    for encoding in _FALLBACK_ENCODINGS[1:]:
+        try:
+            return encoding, str(raw, encoding)
+        except (UnicodeDecodeError, UnicodeError):
+            continue
+    return 'utf-8', str(raw, 'utf-8', 'replace')
 
 
 class DocumentService:
@@ -28,17 +87,48 @@ class DocumentService:
     def __init__(self):
         """初始化文档服务，确保上传目录存在"""
         self._ensure_upload_dir()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_pool_lock = threading.Lock()
+        # PDF 解析结果缓存目录（按文件内容哈希存储）
+        self._parse_cache_dir = Path(settings.UPLOAD_DIR).parent / "parse_cache"
+        # (文件路径, 修改时间, 大小) -> 编码
+        self._encoding_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._encoding_cache_lock = threading.Lock()
+        # (文件路径, 修改时间, 大小) -> 内容哈希，解析缓存与缩略图缓存共用
+        self._digest_memo: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._digest_memo_lock = threading.Lock()
     
     def _ensure_upload_dir(self) -> None:
         """确保上传目录存在"""
         os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     
+    # 切片断点（句号或换行）
+    BOUNDARY_PATTERN = re.compile("[。\n]")
+    
+    # 页码标记，如 [第3页]
+    PAGE_MARKER_PATTERN = re.compile(r"\[第(\d+)页\]")
+    
+    # TXT 编码识别结果缓存的最大条目数
+    ENCODING_CACHE_SIZE = 256
+    # 文件哈希记忆的最大条目数
+    DIGEST_MEMO_SIZE = 1024
+    # TXT 文件每页的估算字符数
+    TXT_CHARS_PER_PAGE = 3000
+    # 文件写入和哈希时的缓冲区大小
+    COPY_BUFFER_SIZE = 1 << 20
+    # 并行提取PDF时每个任务至少处理的页数，以及每个工作进程平均分到的任务数上限
+    # （每个任务都要重新打开文档并解析交叉引用表，大文档按任务数上限放大页段）
+    PDF_PAGES_PER_TASK = 16
+    PDF_TASKS_PER_WORKER = 4
+    
     # 文件魔数字典，用于验证文件类型
     FILE_SIGNATURES = {
         "pdf": [b"%PDF"],  # PDF 文件魔数
         "docx": [b"PK\x03\x04"],  # DOCX (ZIP 压缩格式)
         "txt": None,  # 文本文件无特定魔数
     }
+    # 魔数验证时读取的文件头字节数
+    SIGNATURE_READ_SIZE = 8
     
     def validate_file(self, filename: str, file_size: int, content: Optional[bytes] = None) -> Tuple[bool, str]:
         """
@@ -47,7 +137,7 @@ class DocumentService:
         Args:
             filename: 文件名
             file_size: 文件大小(字节)
-            content: 文件内容(可选，用于验证文件魔数)
+            content: 文件内容或文件头(可选，用于验证文件魔数)
             
         Returns:
             Tuple[bool, str]: (是否有效, 错误消息)
@@ -81,89 +171,490 @@ class DocumentService:
         
         return True, ""
     
-    def save_file(self, filename: str, content: bytes) -> str:
+    def save_file(self, filename: str, content: Union[bytes, BinaryIO]) -> str:
         """
         保存上传的文件到磁盘
         
         Args:
             filename: 原始文件名
-            content: 文件内容
+            content: 文件内容（字节或文件对象，文件对象将分块流式写入）
             
         Returns:
             str: 文件存储路径
         """
-        # 生成唯一文件名，避免冲突
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{filename}"
+        # 生成唯一文件名，避免冲突；只保留原始文件名的最后一段，防止路径穿越
+        basename = os.path.basename(filename.replace("\\", "/"))
+        safe_filename = f"{uuid.uuid4().hex}_{basename}"
         filepath = os.path.join(settings.UPLOAD_DIR, safe_filename)
         
-        with open(filepath, "wb") as f:
-            f.write(content)
+        # 先写入临时文件再原子替换，写入中途失败不会留下被截断的文件
+        tmp_path = filepath + ".part"
+        try:
+            with open(tmp_path, "wb", buffering=self.COPY_BUFFER_SIZE) as f:
+                if isinstance(content, (bytes, bytearray, memoryview)):
+                    f.write(content)
+                else:
+                    content.seek(0)
+                    shutil.copyfileobj(content, f, length=self.COPY_BUFFER_SIZE)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
         
         return filepath
     
-    def extract_text_from_pdf(self, filepath: str) -> Tuple[str, int]:
+    def file_digest(self, filepath: str) -> str:
         """
-        从PDF文件中提取文本
+        计算文件内容哈希（BLAKE2b-128），分块读取，不将整个文件读入内存
+        
+        结果按 (路径, 修改时间, 大小) 记忆，同一文件的解析缓存和缩略图缓存只需读取一次。
+        
+        Args:
+            filepath: 文件路径
+            
+        Returns:
+            str: 十六进制哈希
+        """
+        stat = os.stat(filepath)
+        memo_key = (filepath, stat.st_mtime_ns, stat.st_size)
+        with self._digest_memo_lock:
+            content_hash = self._digest_memo.get(memo_key)
+            if content_hash is not None:
+                self._digest_memo.move_to_end(memo_key)
+                return content_hash
+        
+        with open(filepath, "rb") as f:
+            if hasattr(hashlib, "file_digest"):
+                digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16))
+            else:
+                digest = hashlib.blake2b(digest_size=16)
+                for block in iter(lambda: f.read(self.COPY_BUFFER_SIZE), b""):
+                    digest.update(block)
+        content_hash = digest.hexdigest()
+        
+        with self._digest_memo_lock:
+            self._digest_memo[memo_key] = content_hash
+            if len(self._digest_memo) > self.DIGEST_MEMO_SIZE:
+                self._digest_memo.popitem(last=False)
+        return content_hash
+    
+    def _get_parse_cache_path(self, filepath: str) -> Path:
+        """
+        获取 PDF 解析结果的缓存路径
+        
+        缓存文件首行为包含总页数的 JSON 对象，之后每行一个 JSON 字符串（一页文本）。
         
         Args:
             filepath: PDF文件路径
             
         Returns:
-            Tuple[str, int]: (提取的文本内容, 总页数)
+            Path: 缓存文件路径
         """
-        reader = PdfReader(filepath)
-        text_parts = []
+        return self._parse_cache_dir / f"{self.file_digest(filepath)}.jsonl"
+    
+    def _cache_pages(self, pages: Iterator[str], page_count: int, cache_path: Path) -> Iterator[str]:
+        """
+        透传逐页文本，同时逐页写入解析缓存
         
-        for page_num, page in enumerate(reader.pages, start=1):
-            page_text = page.extract_text()
-            if page_text:
-                # 在每页文本前添加页码标记，便于后续引用
-                text_parts.append(f"[第{page_num}页]\n{page_text}")
+        每页产出时即追加到临时文件，内存中不保留已产出的页面；
+        只有完整解析的结果才原子替换为正式缓存，中途失败或提前停止时删除临时文件。
         
-        full_text = "\n\n".join(text_parts)
-        return full_text, len(reader.pages)
+        Args:
+            pages: 逐页文本迭代器
+            page_count: 总页数
+            cache_path: 缓存文件路径
+            
+        Yields:
+            str: 逐页文本
+        """
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex}.part")
+        f = None
+        try:
+            self._parse_cache_dir.mkdir(parents=True, exist_ok=True)
+            f = open(tmp_path, "wb", buffering=self.COPY_BUFFER_SIZE)
+            f.write(orjson.dumps({"page_count": page_count}) + b"\n")
+        except OSError as e:
+            print(f"⚠ 写入解析缓存失败: {e}")
+            self._discard_cache_file(f, tmp_path)
+            f = None
+        
+        completed = False
+        try:
+            for piece in pages:
+                if f is not None:
+                    try:
+                        f.write(orjson.dumps(piece) + b"\n")
+                    except OSError as e:
+                        print(f"⚠ 写入解析缓存失败: {e}")
+                        self._discard_cache_file(f, tmp_path)
+                        f = None
+                yield piece
+            completed = True
+        finally:
+            if f is not None:
+                if completed:
+                    try:
+                        f.close()
+                        os.replace(tmp_path, cache_path)
+                    except OSError as e:
+                        print(f"⚠ 写入解析缓存失败: {e}")
+                        self._discard_cache_file(None, tmp_path)
+                    else:
+                        self._trim_parse_cache()
+                else:
+                    self._discard_cache_file(f, tmp_path)
     
-    def extract_text_from_txt(self, filepath: str) -> Tuple[str, int]:
+    @staticmethod
+    def _discard_cache_file(f: Optional[BinaryIO], path: Path) -> None:
         """
-        从TXT文件中提取文本
+        关闭并删除未完成的缓存临时文件
         
         Args:
-            filepath: TXT文件路径
+            f: 已打开的文件对象（可选）
+            path: 临时文件路径
+        """
+        try:
+            if f is not None:
+                f.close()
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+    
+    def _read_cached_pages(self, cache_path: Path) -> Optional[Tuple[Iterator[str], int]]:
+        """
+        打开解析缓存，逐行读取页面文本
+        
+        Args:
+            cache_path: 缓存文件路径
             
         Returns:
-            Tuple[str, int]: (提取的文本内容, 总页数估算)
+            Optional[Tuple[Iterator[str], int]]: (逐页文本迭代器, 总页数)，缓存不存在或损坏时返回 None
         """
-        # 尝试多种编码读取
-        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']
-        text = None
+        try:
+            f = open(cache_path, "rb")
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"⚠ 读取解析缓存失败，重新解析: {e}")
+            return None
+        try:
+            page_count = orjson.loads(f.readline())["page_count"]
+        except (OSError, orjson.JSONDecodeError, KeyError, TypeError) as e:
+            f.close()
+            print(f"⚠ 解析缓存损坏，重新解析: {e}")
+            return None
+        
+        # 更新修改时间，容量超限时按最久未使用的顺序淘汰
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        
+        def iter_pages() -> Iterator[str]:
+            with f:
+                for line in f:
+                    yield orjson.loads(line)
+        
+        return iter_pages(), page_count
+    
+    def _trim_parse_cache(self) -> None:
+        """按修改时间淘汰最旧的解析缓存，使目录总大小不超过 PARSE_CACHE_MAX_BYTES"""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self._parse_cache_dir) as it:
+                for entry in it:
+                    # 跳过其他线程正在写入的临时文件
+                    if entry.name.endswith(".part") or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError as e:
+            print(f"⚠ 清理解析缓存失败: {e}")
+            return
         
-        for encoding in encodings:
+        limit = settings.PARSE_CACHE_MAX_BYTES
+        if total <= limit:
+            return
+        for _, size, path in sorted(entries):
             try:
-                with open(filepath, 'r', encoding=encoding) as f:
-                    text = f.read()
-                break
-            except (UnicodeDecodeError, UnicodeError):
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠ 清理解析缓存失败: {e}")
                 continue
+            total -= size
+            if total <= limit:
+                break
+    
+    def extract_text_stream_from_pdf(
+        self,
+        filepath: str,
+        force_refresh: bool = False,
+        parallel: bool = False
+    ) -> Tuple[Iterator[str], int]:
+        """
+        逐页提取PDF文本
+        
+        返回的迭代器每次产出一页带页码标记的文本，拼接后与 extract_text_from_pdf 的结果一致，
+        便于切片在提取过程中同步进行，无需在内存中保留全文。
+        内容相同的文件直接读取解析缓存，跳过 PDF 解析。
+        
+        Args:
+            filepath: PDF文件路径
+            force_refresh: 是否忽略缓存重新解析
+            parallel: 是否允许使用进程池并行提取（不能在进程池的工作进程中使用）
+            
+        Returns:
+            Tuple[Iterator[str], int]: (逐页文本迭代器, 总页数)
+        """
+        cache_path = self._get_parse_cache_path(filepath)
+        if not force_refresh:
+            cached = self._read_cached_pages(cache_path)
+            if cached is not None:
+                return cached
+        
+        if fitz is not None:
+            pages, page_count = self._extract_text_stream_with_fitz(filepath, parallel=parallel)
+        else:
+            pages, page_count = self._extract_text_stream_with_pypdf(filepath)
+        return self._cache_pages(pages, page_count, cache_path), page_count
+    
+    def _extract_text_stream_with_pypdf(self, filepath: str) -> Tuple[Iterator[str], int]:
+        """
+        使用 pypdf 逐页提取PDF文本（未安装 PyMuPDF 时的回退方案）
+        
+        Args:
+            filepath: PDF文件路径
+            
+        Returns:
+            Tuple[Iterator[str], int]: (逐页文本迭代器, 总页数)
+        """
+        # 通过内存映射交给 PdfReader，避免 pypdf 将整个文件复制到内存中
+        f = open(filepath, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            reader = PdfReader(mm)
+        except Exception:
+            f.close()
+            raise
+        
+        def iter_pages() -> Iterator[str]:
+            try:
+                separator = ""
+                for page_num, page in enumerate(reader.pages, start=1):
+                    # 跳过纯图像页，避免解析大型图形内容流
+                    if self._is_image_only_page(page):
+                        continue
+                    page_text = page.extract_text()
+                    if page_text:
+                        # 在每页文本前添加页码标记，便于后续引用
+                        yield f"{separator}[第{page_num}页]\n{page_text}"
+                        separator = "\n\n"
+            finally:
+                mm.close()
+                f.close()
+        
+        return iter_pages(), len(reader.pages)
+    
+    @staticmethod
+    def _is_image_only_page(page) -> bool:
+        """
+        判断 pypdf 页面是否为纯图像页
+        
+        页面资源中没有字体，且引用的 XObject 都是图片（没有可能包含文字的表单对象）时，
+        extract_text() 必然返回空字符串，可以跳过对内容流的解析。
+        
+        Args:
+            page: pypdf 页面对象
+            
+        Returns:
+            bool: 是否为纯图像页
+        """
+        try:
+            resources = page.get("/Resources")
+            if resources is None:
+                return False
+            resources = resources.get_object()
+            if resources.get("/Font"):
+                return False
+            xobjects = resources.get("/XObject")
+            if not xobjects:
+                return False
+            xobjects = xobjects.get_object()
+            return all(
+                xobjects[name].get_object().get("/Subtype") == "/Image"
+                for name in xobjects
+            )
+        except Exception:
+            # 资源结构异常时按普通页面处理
+            return False
+    
+    def _extract_text_stream_with_fitz(
+        self,
+        filepath: str,
+        parallel: bool = False
+    ) -> Tuple[Iterator[str], int]:
+        """
+        使用 PyMuPDF 逐页提取PDF文本
+        
+        parallel 为 True 且页数较多时，按页段拆分到文档解析进程池中并行提取
+        （PyMuPDF 不释放 GIL，线程无法并行），结果仍按页码顺序产出。
+        
+        Args:
+            filepath: PDF文件路径
+            parallel: 是否允许使用进程池并行提取
+            
+        Returns:
+            Tuple[Iterator[str], int]: (逐页文本迭代器, 总页数)
+        """
+        doc = fitz.open(filepath)
+        page_count = doc.page_count
+        
+        pool = None
+        if parallel and page_count >= self.PDF_PAGES_PER_TASK * 2:
+            pool = self._get_process_pool()
+        
+        tasks: List[Tuple[int, int, Future]] = []
+        if pool is not None:
+            max_tasks = self._pool_workers() * self.PDF_TASKS_PER_WORKER
+            pages_per_task = max(self.PDF_PAGES_PER_TASK, -(-page_count // max_tasks))
+            try:
+                for start in range(0, page_count, pages_per_task):
+                    stop = min(start + pages_per_task, page_count)
+                    tasks.append((start, stop, pool.submit(_extract_pdf_page_range, filepath, start, stop)))
+            except (BrokenProcessPool, RuntimeError) as e:
+                self._discard_process_pool(e)
+                for _, _, future in tasks:
+                    future.cancel()
+                tasks = []
+        
+        if tasks:
+            doc.close()
+            
+            def iter_page_texts() -> Iterator[Tuple[int, str]]:
+                try:
+                    for start, stop, future in tasks:
+                        try:
+                            yield from future.result()
+                        except BrokenProcessPool as e:
+                            # 工作进程异常退出时，该页段改在当前进程提取
+                            self._discard_process_pool(e)
+                            yield from _extract_pdf_page_range(filepath, start, stop)
+                finally:
+                    for _, _, future in tasks:
+                        future.cancel()
+        else:
+            def iter_page_texts() -> Iterator[Tuple[int, str]]:
+                try:
+                    for page_num, page in enumerate(doc, start=1):
+                        yield page_num, _fitz_page_text(page)
+                finally:
+                    doc.close()
         
-        if text is None:
-            # 最后尝试以二进制读取并忽略错误
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                text = f.read()
+        def iter_pages() -> Iterator[str]:
+            separator = ""
+            for page_num, page_text in iter_page_texts():
+                if page_text:
+                    # 在每页文本前添加页码标记，便于后续引用
+                    yield f"{separator}[第{page_num}页]\n{page_text}"
+                    separator = "\n\n"
+        
+        return iter_pages(), page_count
+    
+    def extract_text_from_pdf(self, filepath: str) -> Tuple[str, int]:
+        """
+        从PDF文件中提取文本
+        
+        Args:
+            filepath: PDF文件路径
+            
+        Returns:
+            Tuple[str, int]: (提取的文本内容, 总页数)
+        """
+        pages, page_count = self.extract_text_stream_from_pdf(filepath)
+        return "".join(pages), page_count
+    
+    def _read_txt(self, filepath: str) -> str:
+        """
+        读取TXT文件并解码为文本
+        
+        Args:
+            filepath: TXT文件路径
+            
+        Returns:
+            str: 文件文本
+        """
+        # 通过内存映射读取文件，由操作系统负责分页，避免额外复制一份完整字节
+        with open(filepath, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size == 0:
+                text = ""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    cache_key = (filepath, stat.st_mtime_ns, stat.st_size)
+                    with self._encoding_cache_lock:
+                        encoding = self._encoding_cache.get(cache_key)
+                        if encoding is not None:
+                            self._encoding_cache.move_to_end(cache_key)
+                    
+                    if encoding is not None:
+                        text = str(mm, encoding, 'replace')
+                    else:
+                        # 识别编码时的解码结果直接使用，全文只解码一次
+                        encoding, text = _decode_text(mm)
+                        with self._encoding_cache_lock:
+                            self._encoding_cache[cache_key] = encoding
+                            if len(self._encoding_cache) > self.ENCODING_CACHE_SIZE:
+                                self._encoding_cache.popitem(last=False)
+        
+        if text.startswith('\ufeff'):
+            text = text[1:]
+        
+        return text
+    
+    def extract_text_stream_from_txt(self, filepath: str) -> Tuple[Iterator[str], int]:
+        """
+        按估算页逐段产出TXT文本
+        
+        每 TXT_CHARS_PER_PAGE 个字符视为一页并添加页码标记，拼接后与 extract_text_from_txt 的结果一致；
+        逐段产出避免构建分页列表和拼接后的第二份全文。
+        
+        Args:
+            filepath: TXT文件路径
+            
+        Returns:
+            Tuple[Iterator[str], int]: (逐页文本迭代器, 总页数估算)
+        """
+        text = self._read_txt(filepath)
+        chars_per_page = self.TXT_CHARS_PER_PAGE
         
         # 估算页数（假设每页约 3000 字符）
-        estimated_pages = max(1, len(text) // 3000 + 1)
+        estimated_pages = max(1, len(text) // chars_per_page + 1)
         
-        # 添加页码标记（每 3000 字符一页）
-        text_parts = []
-        chars_per_page = 3000
-        for i in range(0, len(text), chars_per_page):
-            page_num = i // chars_per_page + 1
-            page_text = text[i:i + chars_per_page]
-            text_parts.append(f"[第{page_num}页]\n{page_text}")
+        def iter_pages() -> Iterator[str]:
+            separator = ""
+            for page_num, i in enumerate(range(0, len(text), chars_per_page), start=1):
+                yield f"{separator}[第{page_num}页]\n{text[i:i + chars_per_page]}"
+                separator = "\n\n"
         
-        full_text = "\n\n".join(text_parts) if text_parts else text
-        return full_text, estimated_pages
+        return iter_pages(), estimated_pages
+    
+    def extract_text_from_txt(self, filepath: str) -> Tuple[str, int]:
+        """
+        从TXT文件中提取文本
+        
+        Args:
+            filepath: TXT文件路径
+            
+        Returns:
+            Tuple[str, int]: (提取的文本内容, 总页数估算)
+        """
+        pages, estimated_pages = self.extract_text_stream_from_txt(filepath)
+        return "".join(pages), estimated_pages
     
     def extract_text_from_docx(self, filepath: str) -> Tuple[str, int]:
         """
@@ -225,6 +716,29 @@ class DocumentService:
         else:
             raise ValueError(f"不支持的文件类型: .{extension}")
     
+    def extract_text_stream(self, filepath: str, parallel: bool = False) -> Tuple[Iterator[str], int]:
+        """
+        根据文件类型以流式方式提取文本
+        
+        PDF 和 TXT 逐页产出文本；DOCX 一次性产出全文。
+        
+        Args:
+            filepath: 文件路径
+            parallel: 是否允许使用进程池并行提取PDF页面
+            
+        Returns:
+            Tuple[Iterator[str], int]: (文本片段迭代器, 总页数)
+        """
+        extension = filepath.rsplit(".", 1)[-1].lower() if "." in filepath else ""
+        
+        if extension == "pdf":
+            return self.extract_text_stream_from_pdf(filepath, parallel=parallel)
+        if extension == "txt":
+            return self.extract_text_stream_from_txt(filepath)
+        
+        text, page_count = self.extract_text(filepath)
+        return iter((text,)), page_count
+    
     def chunk_text(
         self, 
         text: str, 
@@ -245,36 +759,114 @@ class DocumentService:
         chunk_size = chunk_size or settings.CHUNK_SIZE
         chunk_overlap = chunk_overlap or settings.CHUNK_OVERLAP
         
-        chunks = []
+        chunks, _, _ = self._chunk_buffer(text, 0, 0, 1, chunk_size, chunk_overlap, final=True)
+        return chunks
+    
+    def chunk_text_streaming(
+        self,
+        pieces: Iterable[str],
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None
+    ) -> Iterator[dict]:
+        """
+        对逐段到达的文本进行切片
+        
+        结果与对拼接后的全文调用 chunk_text 完全一致，但只在内存中保留尚未切完的尾部文本，
+        切片在文本到达时即可产出。
+        
+        Args:
+            pieces: 文本片段迭代器（如逐页提取的PDF文本）
+            chunk_size: 每块的大小（字符数）
+            chunk_overlap: 块之间的重叠大小
+            
+        Yields:
+            dict: 切片，包含 content 和 metadata
+        """
+        chunk_size = chunk_size or settings.CHUNK_SIZE
+        chunk_overlap = chunk_overlap or settings.CHUNK_OVERLAP
+        
+        buffer = ""
+        base = 0  # buffer[0] 在全文中的偏移
         start = 0
         current_page = 1
         
-        while start < len(text):
+        for piece in pieces:
+            buffer += piece
+            if start + chunk_size >= base + len(buffer):
+                continue
+            
+            chunks, start, current_page = self._chunk_buffer(
+                buffer, base, start, current_page, chunk_size, chunk_overlap, final=False
+            )
+            yield from chunks
+            
+            # 丢弃已切完的前缀
+            buffer = buffer[start - base:]
+            base = start
+        
+        chunks, _, _ = self._chunk_buffer(
+            buffer, base, start, current_page, chunk_size, chunk_overlap, final=True
+        )
+        yield from chunks
+    
+    def _chunk_buffer(
+        self,
+        text: str,
+        base: int,
+        start: int,
+        current_page: int,
+        chunk_size: int,
+        chunk_overlap: int,
+        final: bool
+    ) -> Tuple[List[dict], int, int]:
+        """
+        对缓冲区文本进行切片
+        
+        Args:
+            text: 缓冲区文本，其首字符位于全文偏移 base 处
+            base: 缓冲区在全文中的起始偏移
+            start: 下一个切片在全文中的起始偏移
+            current_page: 当前页码
+            chunk_size: 每块的大小（字符数）
+            chunk_overlap: 块之间的重叠大小
+            final: 是否为最后一段文本；否则只切出窗口完全落在缓冲区内的切片
+            
+        Returns:
+            Tuple[List[dict], int, int]: (切片列表, 下一个切片的起始偏移, 当前页码)
+        """
+        text_length = base + len(text)
+        
+        # 一次性扫描出所有断点和页码标记的位置，循环中只做二分查找
+        boundaries = [base + m.start() for m in self.BOUNDARY_PATTERN.finditer(text)]
+        marker_starts = []
+        marker_ends = []
+        marker_pages = []
+        for m in self.PAGE_MARKER_PATTERN.finditer(text):
+            marker_starts.append(base + m.start())
+            marker_ends.append(base + m.end())
+            marker_pages.append(int(m.group(1)))
+        
+        # 非最后一段时，窗口末尾之后必须还有文本，才能确定断点
+        limit = text_length if final else text_length - chunk_size
+        chunks = []
+        
+        while start < limit:
             end = start + chunk_size
-            chunk_text = text[start:end]
             
             # 尝试在句号或换行处断开，使切片更完整
-            if end < len(text):
-                # 查找最后一个句号或换行
-                last_period = chunk_text.rfind("。")
-                last_newline = chunk_text.rfind("\n")
-                break_point = max(last_period, last_newline)
-                if break_point > chunk_size // 2:  # 确保切片不会太短
-                    end = start + break_point + 1
-                    chunk_text = text[start:end]
+            if end < text_length:
+                # 查找窗口内最后一个句号或换行
+                idx = bisect_left(boundaries, end) - 1
+                if idx >= 0 and boundaries[idx] - start > chunk_size // 2:  # 确保切片不会太短
+                    end = boundaries[idx] + 1
             
-            # 检测页码标记来确定当前页
-            page_marker = chunk_text.rfind("[第")
-            if page_marker != -1:
-                page_end = chunk_text.find("页]", page_marker)
-                if page_end != -1:
-                    try:
-                        current_page = int(chunk_text[page_marker + 2:page_end])
-                    except ValueError:
-                        pass
+            # 根据窗口内最后一个完整的页码标记确定当前页
+            idx = bisect_right(marker_ends, end) - 1
+            if idx >= 0 and marker_starts[idx] >= start:
+                current_page = marker_pages[idx]
             
             chunks.append({
-                "content": chunk_text.strip(),
+                "content": text[start - base:end - base].strip(),
                 "metadata": {
                     "page": current_page,
                     "start_char": start,
@@ -284,62 +876,134 @@ class DocumentService:
             
             start = end - chunk_overlap
         
-        return chunks
+        return chunks, start, current_page
     
-    async def process_document(
-        self, 
-        db: Session, 
-        doc_id: int, 
-        filepath: str
-    ) -> Tuple[bool, str, int]:
+    @staticmethod
+    def pipeline_batch_size() -> int:
+        """
+        流水线处理时每批向量化的切片数
+        
+        取 CHROMA_ADD_BATCH_SIZE 的 EMBED_CONCURRENCY 倍，使每批在 add_documents 中
+        拆成多个写入批次并发向量化；解析线程最多领先一批。
+        
+        Returns:
+            int: 切片数
         """
-        处理文档：提取文本、切片、向量化
+        return max(1, settings.CHROMA_ADD_BATCH_SIZE) * max(1, settings.EMBED_CONCURRENCY)
+    
+    @staticmethod
+    def _pool_workers() -> int:
+        """文档解析进程池的工作进程数"""
+        return settings.DOC_INGEST_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+    
+    def _get_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """
+        获取文档解析进程池（懒加载）
+        
+        设置 DOC_INGEST_IO_SERIAL 时返回 None，在当前进程中串行解析（适合机械硬盘）。
+        
+        Returns:
+            Optional[ProcessPoolExecutor]: 进程池实例
+        """
+        if settings.DOC_INGEST_IO_SERIAL:
+            return None
+        with self._process_pool_lock:
+            if self._process_pool is None:
+                # 使用 spawn 避免在多线程的服务进程中 fork
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self._pool_workers(),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+    
+    def _discard_process_pool(self, reason: BaseException) -> None:
+        """
+        丢弃已损坏的文档解析进程池，下次使用时重新创建
+        
+        Args:
+            reason: 进程池不可用的原因
+        """
+        print(f"⚠ 文档解析进程池不可用，改为在当前进程解析: {reason}")
+        with self._process_pool_lock:
+            self._process_pool = None
+    
+    def iter_chunk_batches(
+        self,
+        filepath: str,
+        batch_size: Optional[int] = None
+    ) -> Tuple[Iterator[List[dict]], int]:
+        """
+        以流水线方式提取并切分文档，按批产出切片
+        
+        解析和切片在后台线程中进行，通过有界队列交给调用方；调用方在向量化当前批次时，
+        解析线程继续处理后续页面，总耗时接近 max(解析, 向量化) 而非两者之和。
         
         Args:
-            db: 数据库会话
-            doc_id: 文档ID
             filepath: 文件路径
+            batch_size: 每批切片数量（默认 pipeline_batch_size()）
             
         Returns:
-            Tuple[bool, str, int]: (是否成功, 消息, 切片数量)
+            Tuple[Iterator[List[dict]], int]: (切片批次迭代器, 总页数)
         """
-        try:
-            # 更新状态为处理中
-            document_crud.update_document(
-                db, doc_id, 
-                DocumentUpdate(status="processing")
-            )
-            
-            # 提取文本（根据文件类型自动选择方法）
-            text, page_count = self.extract_text(filepath)
-            
-            if not text.strip():
-                raise ValueError("无法从文档中提取文本内容")
-            
-            # 切分文本
-            chunks = self.chunk_text(text)
-            
-            if not chunks:
-                raise ValueError("文本切片失败，未生成任何切片")
-            
-            # TODO: 调用向量服务进行向量化和存储
-            # 这里先跳过向量化步骤，待向量服务实现后补充
-            
-            # 更新文档状态
-            document_crud.update_document(
-                db, doc_id,
-                DocumentUpdate(status="processed", chunk_count=len(chunks))
-            )
-            
-            return True, f"文档处理成功，共 {page_count} 页，生成 {len(chunks)} 个切片", len(chunks)
-            
-        except Exception as e:
-            # 处理失败，更新状态
-            document_crud.update_document(
-                db, doc_id,
-                DocumentUpdate(status="failed", error_message=str(e))
-            )
-            return False, f"文档处理失败: {str(e)}", 0
+        batch_size = batch_size or self.pipeline_batch_size()
+        # 在主进程中调用，大型PDF可按页段交给进程池并行提取
+        pieces, page_count = self.extract_text_stream(filepath, parallel=True)
+        
+        chunk_queue: "queue.Queue" = queue.Queue(maxsize=batch_size)
+        stop = threading.Event()
+        done = object()
+        errors: List[BaseException] = []
+        
+        def produce() -> None:
+            try:
+                for chunk in self.chunk_text_streaming(pieces):
+                    while not stop.is_set():
+                        try:
+                            chunk_queue.put(chunk, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                # 消费方已退出时队列可能已满，此时无需再发送结束标记
+                while not stop.is_set():
+                    try:
+                        chunk_queue.put(done, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        
+        def consume() -> Iterator[List[dict]]:
+            producer = threading.Thread(target=produce, name="chunk-producer", daemon=True)
+            producer.start()
+            try:
+                batch = []
+                while True:
+                    item = chunk_queue.get()
+                    if item is done:
+                        break
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if errors:
+                    raise errors[0]
+                if batch:
+                    yield batch
+            finally:
+                stop.set()
+        
+        return consume(), page_count
+    
+    def shutdown(self) -> None:
+        """关闭文档解析进程池"""
+        with self._process_pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
     
     def delete_file(self, filepath: str) -> bool:
         """
@@ -353,11 +1017,49 @@ class DocumentService:
         """
         try:
             if os.path.exists(filepath):
+                # 同时清理该文件的解析缓存
+                if filepath.lower().endswith(".pdf"):
+                    cache_path = self._get_parse_cache_path(filepath)
+                    if cache_path.exists():
+                        cache_path.unlink()
                 os.remove(filepath)
             return True
         except Exception:
             return False
 
 
+def _fitz_page_text(page) -> str:
+    """
+    提取 PyMuPDF 页面文本
+    
+    没有引用任何字体的页面（扫描件、纯图形页）不可能提取出文本，直接返回空字符串。
+    
+    Args:
+        page: PyMuPDF 页面对象
+        
+    Returns:
+        str: 页面文本
+    """
+    if not page.get_fonts(full=True):
+        return ""
+    return page.get_text("text")
+
+
+def _extract_pdf_page_range(filepath: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """
+    提取PDF指定页段的文本（进程池工作函数）
+    
+    Args:
+        filepath: PDF文件路径
+        start: 起始页索引（从 0 开始）
+        stop: 结束页索引（不含）
+        
+    Returns:
+        List[Tuple[int, str]]: (页码, 页面文本) 列表
+    """
+    with fitz.open(filepath) as doc:
+        return [(i + 1, _fitz_page_text(doc[i])) for i in range(start, stop)]
+
+
 # 创建全局服务实例
 document_service = DocumentService()
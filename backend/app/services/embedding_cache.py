@@ -0,0 +1,173 @@
+"""
+向量缓存模块
+
+按 (嵌入模型, 内容哈希) 在本地 SQLite 中持久化切片向量，数据库文件与 ChromaDB 位于同一持久化目录。
+文档删除后重新上传、或多个文档共享相同内容时，无需再次调用嵌入模型。
+"""
+import sqlite3
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+class EmbeddingCache:
+    """
+    向量缓存类
+    
+    向量按每个向量一个缩放系数量化为 int8 存储（4 字节 float32 缩放系数 + 每维 1 字节），
+    体积约为 float32 的四分之一，反量化后余弦相似度误差可忽略。
+    条目数超过 EMBEDDING_CACHE_MAX_ENTRIES 时按最近使用时间淘汰。
+    """
+    
+    # SQLite 单条语句的参数数量上限（保守取值，兼容旧版本 SQLite）
+    MAX_SQL_PARAMS = 900
+    # 超出上限时淘汰到上限的该比例，避免每次写入都触发淘汰
+    EVICT_TARGET_RATIO = 0.9
+    
+    def __init__(self, db_path: str, legacy_path: Optional[str] = None):
+        """
+        初始化向量缓存
+        
+        Args:
+            db_path: SQLite 数据库文件路径
+            legacy_path: 旧版数据库文件路径（可选），新文件不存在时迁移过来
+        """
+        self._db_path = db_path
+        self._legacy_path = legacy_path
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _get_conn(self) -> sqlite3.Connection:
+        """获取数据库连接（懒加载，调用方需持有锁）"""
+        if self._conn is None:
+            Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+            if self._legacy_path and not os.path.exists(self._db_path) and os.path.exists(self._legacy_path):
+                try:
+                    os.replace(self._legacy_path, self._db_path)
+                except OSError as e:
+                    print(f"⚠ 迁移向量缓存失败: {e}")
+            conn = sqlite3.connect(self._db_path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache_q8 ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL, "
+                "used INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+            )
+            # 旧版表没有最近使用时间列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(embedding_cache_q8)")}
+            if "used" not in columns:
+                conn.execute("ALTER TABLE embedding_cache_q8 ADD COLUMN used INTEGER NOT NULL DEFAULT 0")
+            # 淘汰和计数都走这个较小的索引，不扫描向量数据
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_q8_used ON embedding_cache_q8 (used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    
+    @staticmethod
+    def _quantize(embedding: Sequence[float]) -> bytes:
+        """将向量量化为 (float32 缩放系数 + int8 分量) 字节串"""
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        max_abs = float(np.abs(vec).max()) if vec.size else 0.0
+        scale = np.float32(max_abs / 127.0 if max_abs > 0.0 else 1.0)
+        quantized = np.round(vec / scale).astype(np.int8)
+        return scale.tobytes() + quantized.tobytes()
+    
+    @staticmethod
+    def _dequantize(blob: bytes) -> List[float]:
+        """将量化字节串还原为浮点向量"""
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return (np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale).tolist()
+    
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        批量查找缓存的向量
+        
+        Args:
+            model: 嵌入模型标识
+            hashes: 内容哈希
+        
+        Returns:
+            Dict[str, List[float]]: 内容哈希 -> 向量（只包含命中的条目）
+        """
+        keys = list(set(hashes))
+        found: Dict[str, List[float]] = {}
+        now = time.time_ns()
+        with self._lock:
+            conn = self._get_conn()
+            for i in range(0, len(keys), self.MAX_SQL_PARAMS):
+                batch = keys[i:i + self.MAX_SQL_PARAMS]
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM embedding_cache_q8 WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for content_hash, vec in rows:
+                    found[content_hash] = self._dequantize(vec)
+                # 刷新命中条目的最近使用时间
+                if rows:
+                    hit = [content_hash for content_hash, _ in rows]
+                    conn.execute(
+                        f"UPDATE embedding_cache_q8 SET used = ? WHERE model = ? AND hash IN ({','.join('?' * len(hit))})",
+                        [now, model, *hit]
+                    )
+            if found:
+                conn.commit()
+        return found
+    
+    def put_many(self, model: str, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        """
+        批量写入向量
+        
+        Args:
+            model: 嵌入模型标识
+            items: (内容哈希, 向量) 序列
+        """
+        now = time.time_ns()
+        rows = [
+            (model, content_hash, self._quantize(embedding), now)
+            for content_hash, embedding in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._get_conn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache_q8 (model, hash, vec, used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict(conn)
+            conn.commit()
+    
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """条目数超过上限时删除最久未使用的条目（调用方需持有锁）"""
+        max_entries = settings.EMBEDDING_CACHE_MAX_ENTRIES
+        if max_entries <= 0:
+            return
+        (count,) = conn.execute("SELECT COUNT(*) FROM embedding_cache_q8").fetchone()
+        if count <= max_entries:
+            return
+        excess = count - int(max_entries * self.EVICT_TARGET_RATIO)
+        conn.execute(
+            "DELETE FROM embedding_cache_q8 WHERE (model, hash) IN "
+            "(SELECT model, hash FROM embedding_cache_q8 ORDER BY used LIMIT ?)",
+            (excess,)
+        )
+    
+    def clear(self) -> None:
+        """清空缓存（重置向量集合时调用）"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM embedding_cache_q8")
+            conn.commit()
+
+
+# 创建全局缓存实例
+embedding_cache = EmbeddingCache(
+    str(Path(settings.CHROMA_PERSIST_DIRECTORY) / "embedding_cache.db"),
+    legacy_path=str(Path(settings.CHROMA_PERSIST_DIRECTORY).parent / "embedding_cache.db")
+)
@@ -0,0 +1,238 @@
+"""
+语义缓存模块
+
+按问题向量的余弦相似度缓存 LLM 回答，语义相同的问题可直接复用已有回答。
+规范化后文本完全相同的问题走精确匹配，连问题向量化也可跳过。
+"""
+import hashlib
+import itertools
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+@dataclass
+class CacheEntry:
+    """
+    语义缓存条目
+    
+    Attributes:
+        scope: 缓存作用域（排序后的文档ID元组，None 表示所有文档）
+        embedding: 归一化后的问题向量
+        answer: LLM 回答
+        sources: 来源信息（可直接序列化的字典列表）
+        usage: 生成该回答时的 Token 用量
+        question_key: 规范化问题的哈希（用于精确匹配）
+    """
+    scope: Hashable
+    embedding: Optional[np.ndarray]
+    answer: str
+    sources: List[dict]
+    usage: Optional[dict]
+    question_key: Optional[bytes] = None
+
+
+def question_key(question: str) -> bytes:
+    """
+    计算问题的精确匹配键
+    
+    经 NFKC 规范化、去除首尾空白、合并连续空白并转为小写后取 BLAKE2b 哈希。
+    
+    Args:
+        question: 用户问题
+        
+    Returns:
+        bytes: 16 字节哈希
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", question).lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+class SemanticCache:
+    """
+    语义缓存类
+    
+    以 LRU 策略保存最近的 (问题向量, 回答, 来源, 用量)，
+    查找时仅与同一作用域内的条目比较相似度；同时按 (作用域, 问题哈希) 建立精确匹配索引。
+    """
+    
+    def __init__(self, max_entries: int = 2000, threshold: float = 0.95):
+        """
+        初始化语义缓存
+        
+        Args:
+            max_entries: 最大缓存条目数
+            threshold: 命中所需的最小余弦相似度
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        # 作用域 -> 条目ID列表，以及对应的 (条目ID, 堆叠向量矩阵)（插入/淘汰时失效）
+        self._scopes: Dict[Hashable, List[int]] = {}
+        self._matrices: Dict[Hashable, Tuple[List[int], Optional[np.ndarray]]] = {}
+        # (作用域, 问题哈希) -> 条目ID
+        self._exact: Dict[Tuple[Hashable, bytes], int] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        """将向量转换为单位长度的 float32 数组，零向量返回 None"""
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+    
+    def _get_matrix(self, scope: Hashable) -> Tuple[List[int], Optional[np.ndarray]]:
+        """获取作用域内的条目ID及堆叠后的向量矩阵"""
+        cached = self._matrices.get(scope)
+        if cached is None:
+            # 只有携带问题向量的条目参与相似度比较
+            ids = [i for i in self._scopes.get(scope, ()) if self._entries[i].embedding is not None]
+            matrix = np.stack([self._entries[i].embedding for i in ids]) if ids else None
+            cached = (ids, matrix)
+            self._matrices[scope] = cached
+        return cached
+    
+    def lookup_exact(self, scope: Hashable, key: bytes) -> Optional[CacheEntry]:
+        """
+        按规范化问题精确查找缓存回答
+        
+        Args:
+            scope: 缓存作用域
+            key: question_key() 计算出的问题哈希
+        
+        Returns:
+            Optional[CacheEntry]: 命中的缓存条目，未命中返回 None
+        """
+        with self._lock:
+            entry_id = self._exact.get((scope, key))
+            if entry_id is None:
+                return None
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id]
+    
+    def lookup(self, scope: Hashable, embedding: Sequence[float]) -> Optional[CacheEntry]:
+        """
+        查找语义相似的缓存回答
+        
+        Args:
+            scope: 缓存作用域
+            embedding: 问题向量
+        
+        Returns:
+            Optional[CacheEntry]: 命中的缓存条目，未命中返回 None
+        """
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+        
+        with self._lock:
+            ids, matrix = self._get_matrix(scope)
+            if matrix is None or matrix.shape[1] != query.shape[0]:
+                return None
+            
+            sims = matrix @ query
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id]
+    
+    def insert(
+        self,
+        scope: Hashable,
+        embedding: Optional[Sequence[float]],
+        answer: str,
+        sources: List[dict],
+        usage: Optional[dict] = None,
+        key: Optional[bytes] = None
+    ) -> None:
+        """
+        写入一条缓存
+        
+        Args:
+            scope: 缓存作用域
+            embedding: 问题向量（为 None 时只参与精确匹配）
+            answer: LLM 回答
+            sources: 来源信息
+            usage: Token 用量
+            key: 问题哈希
+        """
+        vec = self._normalize(embedding) if embedding is not None else None
+        if vec is None and key is None:
+            return
+        
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = CacheEntry(scope, vec, answer, sources, usage, key)
+            self._scopes.setdefault(scope, []).append(entry_id)
+            self._matrices.pop(scope, None)
+            if key is not None:
+                old_id = self._exact.get((scope, key))
+                if old_id is not None:
+                    self._remove_entry(old_id)
+                self._exact[(scope, key)] = entry_id
+            
+            while len(self._entries) > self.max_entries:
+                old_id = next(iter(self._entries))
+                self._remove_entry(old_id)
+    
+    def _remove_entry(self, entry_id: int) -> None:
+        """移除条目及其索引"""
+        entry = self._entries.pop(entry_id)
+        self._remove_from_scope(entry.scope, entry_id)
+        if entry.question_key is not None:
+            exact_key = (entry.scope, entry.question_key)
+            if self._exact.get(exact_key) == entry_id:
+                del self._exact[exact_key]
+    
+    def _remove_from_scope(self, scope: Hashable, entry_id: int) -> None:
+        """从作用域索引中移除条目"""
+        ids = self._scopes.get(scope)
+        if ids is None:
+            return
+        ids.remove(entry_id)
+        if not ids:
+            del self._scopes[scope]
+        self._matrices.pop(scope, None)
+    
+    def invalidate(self, doc_id: Optional[int] = None) -> None:
+        """
+        使缓存失效
+        
+        Args:
+            doc_id: 文档ID，为 None 时清空全部缓存
+        """
+        with self._lock:
+            if doc_id is None:
+                self._entries.clear()
+                self._scopes.clear()
+                self._matrices.clear()
+                self._exact.clear()
+                return
+            
+            # 未限定文档的检索 (scope=None) 也可能引用该文档
+            for scope in [s for s in self._scopes if s is None or doc_id in s]:
+                for entry_id in self._scopes.pop(scope):
+                    self._entries.pop(entry_id, None)
+                self._matrices.pop(scope, None)
+            self._exact = {
+                k: v for k, v in self._exact.items() if v in self._entries
+            }
+
+
+# 创建全局缓存实例
+semantic_cache = SemanticCache(
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD
+)
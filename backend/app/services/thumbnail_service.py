@@ -4,13 +4,24 @@
 处理 PDF 缩略图的生成和缓存。
 """
 import asyncio
-import hashlib
 import io
+import multiprocessing
 import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
 
 from app.core.config import settings
+from app.services.doc_service import document_service
 
 
 class ThumbnailService:
@@ -26,59 +37,87 @@ class ThumbnailService:
     THUMBNAIL_FORMAT = "PNG"
     THUMBNAIL_QUALITY = 85
     
+    # PDF 文件头魔数，用于在打开文件前快速排除非 PDF
+    PDF_SIGNATURE = b"%PDF-"
+    
     def __init__(self):
         """初始化缩略图服务"""
         self._cache_dir = Path(settings.UPLOAD_DIR).parent / "thumbnails"
         self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_pool_lock = threading.Lock()
+        # 扩展名 -> 占位图数据（占位图只取决于扩展名，生成一次即可）
+        self._placeholders: Dict[str, bytes] = {}
+        # 每个线程复用一块白色背景像素缓冲区，避免每次生成缩略图都重新分配
+        self._buffers = threading.local()
     
-    def _get_cache_path(self, doc_id: int) -> Path:
+    def _get_cache_path(self, file_path: str) -> Path:
         """
         获取缩略图缓存路径
         
+        PDF 按文件内容哈希缓存，重复上传的相同文件共用同一缩略图；
+        文本类文件的占位图只取决于扩展名，按扩展名缓存。
+        
         Args:
-            doc_id: 文档 ID
+            file_path: 文件路径
             
         Returns:
             Path: 缓存文件路径
         """
+        extension = file_path.rsplit(".", 1)[-1].lower() if "." in file_path else ""
+        if extension != "pdf":
+            return self._cache_dir / f"placeholder_{extension}.png"
+        return self._cache_dir / f"{document_service.file_digest(file_path)}.png"
+    
+    def _get_legacy_cache_path(self, doc_id: int) -> Path:
+        """获取旧版按文档 ID 命名的缩略图缓存路径"""
         return self._cache_dir / f"{doc_id}.png"
     
-    def get_cached_thumbnail(self, doc_id: int) -> Optional[bytes]:
+    def get_cached_thumbnail(self, file_path: str) -> Optional[bytes]:
         """
         获取缓存的缩略图
         
         Args:
-            doc_id: 文档 ID
+            file_path: 文件路径
             
         Returns:
             Optional[bytes]: 缩略图数据，如果没有缓存则返回 None
         """
-        cache_path = self._get_cache_path(doc_id)
+        extension = file_path.rsplit(".", 1)[-1].lower() if "." in file_path else ""
+        placeholder = self._placeholders.get(extension)
+        if placeholder is not None:
+            return placeholder
+        
+        cache_path = self._get_cache_path(file_path)
         if cache_path.exists():
             return cache_path.read_bytes()
         return None
     
-    def save_thumbnail_cache(self, doc_id: int, data: bytes) -> None:
+    def save_thumbnail_cache(self, file_path: str, data: bytes) -> None:
         """
         保存缩略图到缓存
         
         Args:
-            doc_id: 文档 ID
+            file_path: 文件路径
             data: 缩略图数据
         """
-        cache_path = self._get_cache_path(doc_id)
+        cache_path = self._get_cache_path(file_path)
         cache_path.write_bytes(data)
     
-    def delete_thumbnail_cache(self, doc_id: int) -> None:
+    def delete_thumbnail_cache(self, doc_id: int, file_path: Optional[str] = None) -> None:
         """
         删除缩略图缓存
         
         Args:
             doc_id: 文档 ID
+            file_path: 文件路径（提供时同时删除按内容哈希缓存的 PDF 缩略图）
         """
-        cache_path = self._get_cache_path(doc_id)
-        if cache_path.exists():
-            cache_path.unlink()
+        paths = [self._get_legacy_cache_path(doc_id)]
+        if file_path and file_path.lower().endswith(".pdf") and os.path.exists(file_path):
+            paths.append(self._get_cache_path(file_path))
+        for cache_path in paths:
+            if cache_path.exists():
+                cache_path.unlink()
     
     def generate_thumbnail(self, file_path: str) -> Optional[bytes]:
         """
@@ -109,10 +148,11 @@ class ThumbnailService:
         Returns:
             Optional[bytes]: PNG 格式的缩略图数据
         """
+        # 先校验文件头，非 PDF 无需打开文档
+        if fitz is None or not self._has_pdf_signature(pdf_path):
+            return None
+        
         try:
-            import fitz  # PyMuPDF
-            from PIL import Image
-            
             # 打开 PDF
             doc = fitz.open(pdf_path)
             if doc.page_count == 0:
@@ -128,16 +168,24 @@ class ThumbnailService:
             scale_y = self.THUMBNAIL_HEIGHT / rect.height
             scale = min(scale_x, scale_y)
             
-            # 渲染页面为图像
-            mat = fitz.Matrix(scale * 2, scale * 2)  # 2x 超采样以提高质量
+            # 直接按目标尺寸渲染页面，由 PyMuPDF 完成缩放，无需超采样后再缩小
+            mat = fitz.Matrix(scale, scale)
             pix = page.get_pixmap(matrix=mat, alpha=False)
             
             doc.close()
             
-            # 转换为 PIL Image
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # 调整到目标尺寸
+            # 常见情况：渲染结果不超过目标尺寸，直接在 PyMuPDF 中合成并用其原生编码器输出 PNG
+            if pix.width <= self.THUMBNAIL_WIDTH and pix.height <= self.THUMBNAIL_HEIGHT:
+                if pix.width == self.THUMBNAIL_WIDTH and pix.height == self.THUMBNAIL_HEIGHT:
+                    return pix.tobytes("png")
+                background = self._get_background()
+                pix.set_origin((self.THUMBNAIL_WIDTH - pix.width) // 2, (self.THUMBNAIL_HEIGHT - pix.height) // 2)
+                background.copy(pix, pix.irect)
+                return background.tobytes("png")
+            
+            # 舍入误差导致略大于目标尺寸时再用 PIL 缩小
+            # 直接引用像素缓冲区构建 PIL Image，避免复制；thumbnail 缩放时生成新的像素数据，不会写入 pix 的缓冲区
+            img = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1)
             img.thumbnail((self.THUMBNAIL_WIDTH, self.THUMBNAIL_HEIGHT), Image.Resampling.LANCZOS)
             
             # 创建白色背景并居中放置缩略图
@@ -145,9 +193,9 @@ class ThumbnailService:
             offset = ((self.THUMBNAIL_WIDTH - img.width) // 2, (self.THUMBNAIL_HEIGHT - img.height) // 2)
             background.paste(img, offset)
             
-            # 保存为 PNG
+            # 保存为 PNG（不做 optimize 多遍压缩，其耗时远超收益）
             buffer = io.BytesIO()
-            background.save(buffer, format=self.THUMBNAIL_FORMAT, optimize=True)
+            background.save(buffer, format=self.THUMBNAIL_FORMAT)
             
             return buffer.getvalue()
             
@@ -155,6 +203,36 @@ class ThumbnailService:
             print(f"生成PDF缩略图失败: {e}")
             return None
     
+    def _get_background(self) -> "fitz.Pixmap":
+        """
+        获取当前线程复用的白色背景像素缓冲区（已清空为白色）
+        
+        Returns:
+            fitz.Pixmap: 缩略图尺寸的 RGB 像素缓冲区
+        """
+        background = getattr(self._buffers, "background", None)
+        if background is None:
+            background = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, self.THUMBNAIL_WIDTH, self.THUMBNAIL_HEIGHT), False)
+            self._buffers.background = background
+        background.clear_with(255)
+        return background
+    
+    def _has_pdf_signature(self, file_path: str) -> bool:
+        """
+        检查文件头是否为 PDF 魔数
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            bool: 是否为 PDF 文件
+        """
+        try:
+            with open(file_path, "rb") as f:
+                return f.read(len(self.PDF_SIGNATURE)) == self.PDF_SIGNATURE
+        except OSError:
+            return False
+    
     def _generate_text_placeholder(self, extension: str) -> Optional[bytes]:
         """
         为文本类文件生成占位符缩略图
@@ -165,9 +243,11 @@ class ThumbnailService:
         Returns:
             Optional[bytes]: PNG 格式的缩略图数据
         """
+        placeholder = self._placeholders.get(extension)
+        if placeholder is not None:
+            return placeholder
+        
         try:
-            from PIL import Image, ImageDraw, ImageFont
-            
             # 创建白色背景
             img = Image.new("RGB", (self.THUMBNAIL_WIDTH, self.THUMBNAIL_HEIGHT), (250, 250, 250))
             draw = ImageDraw.Draw(img)
@@ -240,12 +320,94 @@ class ThumbnailService:
             buffer = io.BytesIO()
             img.save(buffer, format=self.THUMBNAIL_FORMAT, optimize=True)
             
-            return buffer.getvalue()
+            placeholder = buffer.getvalue()
+            self._placeholders[extension] = placeholder
+            return placeholder
             
         except Exception as e:
             print(f"生成占位符缩略图失败: {e}")
             return None
     
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        """
+        获取缩略图渲染进程池（懒加载）
+        
+        渲染和 PNG 编码属于 CPU 密集型操作，放到独立进程池中执行，
+        不占用 HTTP 请求线程，也不与文档解析进程池争抢。
+        
+        Returns:
+            ProcessPoolExecutor: 进程池实例
+        """
+        with self._process_pool_lock:
+            if self._process_pool is None:
+                # 使用 spawn 避免在多线程的服务进程中 fork
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=max(1, (os.cpu_count() or 2) - 1),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+    
+    def _submit_render(self, file_path: str) -> Optional[Future]:
+        """
+        将缩略图生成任务提交到进程池
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            Optional[Future]: 任务句柄，进程池不可用时返回 None
+        """
+        try:
+            return self._get_process_pool().submit(_render_thumbnail, file_path)
+        except (BrokenProcessPool, RuntimeError) as e:
+            print(f"⚠ 缩略图进程池不可用，改为在当前进程生成: {e}")
+            with self._process_pool_lock:
+                self._process_pool = None
+            return None
+    
+    def _needs_render(self, file_path: str) -> bool:
+        """判断是否需要交给进程池渲染（仅有效的 PDF，占位图和无效文件在当前进程即可快速返回）"""
+        return file_path.lower().endswith(".pdf") and fitz is not None and self._has_pdf_signature(file_path)
+    
+    def _render(self, file_path: str) -> Optional[bytes]:
+        """
+        在进程池中生成缩略图，进程池异常时回退到当前进程
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            Optional[bytes]: PNG 格式的缩略图数据
+        """
+        future = self._submit_render(file_path) if self._needs_render(file_path) else None
+        if future is not None:
+            try:
+                return future.result()
+            except BrokenProcessPool as e:
+                print(f"⚠ 缩略图进程异常退出，改为在当前进程生成: {e}")
+                with self._process_pool_lock:
+                    self._process_pool = None
+        return self.generate_thumbnail(file_path)
+    
+    async def _render_async(self, file_path: str) -> Optional[bytes]:
+        """异步版本的 _render，等待期间不阻塞事件循环"""
+        future = self._submit_render(file_path) if self._needs_render(file_path) else None
+        if future is not None:
+            try:
+                return await asyncio.wrap_future(future)
+            except BrokenProcessPool as e:
+                print(f"⚠ 缩略图进程异常退出，改为在当前进程生成: {e}")
+                with self._process_pool_lock:
+                    self._process_pool = None
+        return await asyncio.to_thread(self.generate_thumbnail, file_path)
+    
+    def shutdown(self) -> None:
+        """关闭缩略图渲染进程池"""
+        with self._process_pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+    
     async def generate_thumbnail_async(self, doc_id: int, file_path: str) -> bool:
         """
         异步生成并缓存缩略图
@@ -257,19 +419,66 @@ class ThumbnailService:
         Returns:
             bool: 是否成功
         """
-        # 在线程池中执行同步的图像处理
-        loop = asyncio.get_event_loop()
-        thumbnail_data = await loop.run_in_executor(
-            None, 
-            self.generate_thumbnail, 
-            file_path
-        )
+        # 在独立进程池中执行图像处理
+        thumbnail_data = await self._render_async(file_path)
         
         if thumbnail_data:
-            self.save_thumbnail_cache(doc_id, thumbnail_data)
+            await asyncio.to_thread(self.save_thumbnail_cache, file_path, thumbnail_data)
             return True
         return False
     
+    async def get_or_generate_thumbnail_async(self, doc_id: int, file_path: str) -> Optional[bytes]:
+        """
+        获取或生成缩略图（异步版本）
+        
+        缓存查找（含文件哈希）在线程中执行，生成在进程池中执行，均不阻塞事件循环。
+        
+        Args:
+            doc_id: 文档 ID
+            file_path: 文件路径
+            
+        Returns:
+            Optional[bytes]: 缩略图数据
+        """
+        cached = await asyncio.to_thread(self._load_cached_or_legacy, doc_id, file_path)
+        if cached:
+            return cached
+        
+        thumbnail_data = await self._render_async(file_path)
+        if thumbnail_data:
+            await asyncio.to_thread(self.save_thumbnail_cache, file_path, thumbnail_data)
+        
+        return thumbnail_data
+    
+    def _load_cached_or_legacy(self, doc_id: int, file_path: str) -> Optional[bytes]:
+        """
+        读取缓存的缩略图，必要时迁移旧版按文档 ID 命名的缓存
+        
+        Args:
+            doc_id: 文档 ID
+            file_path: 文件路径
+            
+        Returns:
+            Optional[bytes]: 缩略图数据，如果没有缓存则返回 None
+        """
+        cached = self.get_cached_thumbnail(file_path)
+        if cached:
+            return cached
+        
+        legacy_path = self._get_legacy_cache_path(doc_id)
+        if legacy_path.exists():
+            # 并发请求可能已抢先完成迁移，此时旧文件已不存在，改读迁移后的缓存
+            try:
+                thumbnail_data = legacy_path.read_bytes()
+            except FileNotFoundError:
+                return self.get_cached_thumbnail(file_path)
+            try:
+                os.replace(legacy_path, self._get_cache_path(file_path))
+            except FileNotFoundError:
+                pass
+            return thumbnail_data
+        return None
+    
     def get_or_generate_thumbnail(self, doc_id: int, file_path: str) -> Optional[bytes]:
         """
         获取或生成缩略图（同步版本）
@@ -283,18 +492,31 @@ class ThumbnailService:
         Returns:
             Optional[bytes]: 缩略图数据
         """
-        # 先检查缓存
-        cached = self.get_cached_thumbnail(doc_id)
+        # 先检查缓存（含旧版缓存迁移）
+        cached = self._load_cached_or_legacy(doc_id, file_path)
         if cached:
             return cached
         
         # 生成新的缩略图
-        thumbnail_data = self.generate_thumbnail(file_path)
+        thumbnail_data = self._render(file_path)
         if thumbnail_data:
-            self.save_thumbnail_cache(doc_id, thumbnail_data)
+            self.save_thumbnail_cache(file_path, thumbnail_data)
         
         return thumbnail_data
 
 
+def _render_thumbnail(file_path: str) -> Optional[bytes]:
+    """
+    在缩略图进程池的子进程中生成缩略图
+    
+    Args:
+        file_path: 文件路径
+        
+    Returns:
+        Optional[bytes]: PNG 格式的缩略图数据
+    """
+    return thumbnail_service.generate_thumbnail(file_path)
+
+
 # 创建全局服务实例
 thumbnail_service = ThumbnailService()
@@ -4,13 +4,23 @@
 负责文本向量化、向量存储和语义检索。
 支持使用 OpenAI Embedding 或 ChromaDB 默认嵌入。
 """
+import hashlib
 import os
-from typing import List, Optional
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from typing import TYPE_CHECKING, Dict, Hashable, Iterator, List, Optional, Tuple, Union
 
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+import numpy as np
 
 from app.core.config import settings
+from app.services.embedding_cache import embedding_cache
+
+if TYPE_CHECKING:
+    import chromadb
 
 
 class VectorService:
@@ -21,11 +31,37 @@ class VectorService:
     支持配置 OpenAI Embedding 或使用默认嵌入。
     """
     
+    # 单次嵌入请求的估算 Token 上限（低于 OpenAI 每请求 30 万 Token 的限制）
+    # 中文文本约每字一个 Token，按字符数保守估算
+    EMBED_MAX_TOKENS_PER_REQUEST = 240_000
+    
+    # 获取文档开头内容时最多读取的切片数
+    FIRST_PAGE_SCAN_CHUNKS = 64
+    
+    # 检索默认返回的字段
+    DEFAULT_QUERY_INCLUDE = ["documents", "metadatas", "distances"]
+    
+    # 查询向量及检索结果缓存的最大条目数，检索结果缓存的有效期（秒）
+    QUERY_CACHE_SIZE = 512
+    SEARCH_CACHE_TTL = 60.0
+    
     def __init__(self):
         """初始化向量服务"""
-        self._client: Optional[chromadb.ClientAPI] = None
+        self._client: Optional["chromadb.ClientAPI"] = None
         self._collection = None
         self._embedding_function = None
+        self._embedding_model_name: Optional[str] = None
+        self._collection_embedding_function = None
+        # 集合实际使用的嵌入模型标识，作为向量缓存键的一部分
+        self._embedding_model_key: Optional[str] = None
+        # 并发计算各批次向量的线程池（嵌入请求受网络延迟限制，线程即可重叠等待）
+        self._embed_executor: Optional[ThreadPoolExecutor] = None
+        self._embed_executor_lock = threading.Lock()
+        # (嵌入模型, 查询文本) -> 查询向量
+        self._query_embeddings: "OrderedDict[Tuple[Optional[str], str], List[float]]" = OrderedDict()
+        # (查询文本, 文档过滤, Top-K, 返回字段) -> (过期时间, 检索结果)；集合写入或删除时清空
+        self._search_cache: "OrderedDict[Tuple[str, Hashable, int, Tuple[str, ...]], Tuple[float, List[dict]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         self._ensure_persist_dir()
     
     def _ensure_persist_dir(self) -> None:
@@ -53,6 +89,7 @@ class VectorService:
                         api_base=config.get("api_base"),
                         model_name=config.get("embedding_model", "text-embedding-ada-002")
                     )
+                    self._embedding_model_name = config.get("embedding_model", "text-embedding-ada-002")
                     print(f"✓ 使用 OpenAI Embedding 模型: {config.get('embedding_model')}")
                 except Exception as e:
                     print(f"⚠ OpenAI Embedding 初始化失败，使用默认嵌入: {e}")
@@ -62,7 +99,7 @@ class VectorService:
         return self._embedding_function
     
     @property
-    def client(self) -> chromadb.ClientAPI:
+    def client(self) -> "chromadb.ClientAPI":
         """
         获取 ChromaDB 客户端（懒加载）
         
@@ -70,6 +107,8 @@ class VectorService:
             chromadb.ClientAPI: ChromaDB 客户端实例
         """
         if self._client is None:
+            # 首次使用时才导入 ChromaDB，不需要向量库的进程（如文档解析、缩略图工作进程）无需承担其导入开销
+            import chromadb
             self._client = chromadb.PersistentClient(
                 path=settings.CHROMA_PERSIST_DIRECTORY
             )
@@ -85,6 +124,14 @@ class VectorService:
         """
         if self._collection is None:
             embedding_fn = self._get_embedding_function()
+            if embedding_fn is None:
+                from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+                embedding_fn = DefaultEmbeddingFunction()
+                self._embedding_model_key = "chroma-default"
+            else:
+                self._embedding_model_key = f"openai:{self._embedding_model_name}"
+            # 记录集合实际使用的嵌入函数，供 embed_query 复用
+            self._collection_embedding_function = embedding_fn
             try:
                 self._collection = self.client.get_or_create_collection(
                     name=settings.CHROMA_COLLECTION_NAME,
@@ -130,14 +177,185 @@ class VectorService:
         
         self._collection = None
         self._embedding_function = None
+        with self._cache_lock:
+            self._query_embeddings.clear()
+            self._search_cache.clear()
+        # 集合重建后旧向量全部失效，本地向量缓存一并清空
+        try:
+            embedding_cache.clear()
+        except Exception as e:
+            print(f"⚠ 清空向量缓存失败: {e}")
         # 触发重建
         _ = self.collection
         print(f"✓ 集合已重置")
     
+    def embed_query(self, query: str) -> List[float]:
+        """
+        计算查询文本的向量
+        
+        使用与集合相同的嵌入函数，得到的向量可直接传给 search。
+        
+        Args:
+            query: 查询文本
+            
+        Returns:
+            List[float]: 查询向量
+        """
+        _ = self.collection
+        cache_key = (self._embedding_model_key, query)
+        with self._cache_lock:
+            embedding = self._query_embeddings.get(cache_key)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(cache_key)
+                return embedding
+        
+        embedding = self._collection_embedding_function([query])[0]
+        with self._cache_lock:
+            self._query_embeddings[cache_key] = embedding
+            if len(self._query_embeddings) > self.QUERY_CACHE_SIZE:
+                self._query_embeddings.popitem(last=False)
+        return embedding
+    
+    def _invalidate_search_cache(self) -> None:
+        """集合内容变化后清空检索结果缓存"""
+        with self._cache_lock:
+            self._search_cache.clear()
+    
+    @staticmethod
+    def _content_hash(content: str) -> str:
+        """计算切片内容的哈希（BLAKE2b-128 十六进制）"""
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _get_embed_executor(self) -> ThreadPoolExecutor:
+        """获取嵌入线程池（懒加载）"""
+        with self._embed_executor_lock:
+            if self._embed_executor is None:
+                self._embed_executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.EMBED_CONCURRENCY),
+                    thread_name_prefix="embed"
+                )
+            return self._embed_executor
+    
+    def _embed_texts(self, texts: List[str]) -> list:
+        """
+        批量计算文本向量
+        
+        每次请求携带尽可能多的文本，超过单次请求的 Token 上限时拆分为多次请求。
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            list: 与 texts 对应的向量列表
+        """
+        embeddings = []
+        batch: List[str] = []
+        batch_tokens = 0
+        for text in texts:
+            if batch and batch_tokens + len(text) > self.EMBED_MAX_TOKENS_PER_REQUEST:
+                embeddings.extend(self._collection_embedding_function(batch))
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += len(text)
+        if batch:
+            embeddings.extend(self._collection_embedding_function(batch))
+        return embeddings
+    
+    def _embed_deduplicated(self, documents: List[str], hashes: List[str]) -> List[List[float]]:
+        """
+        计算切片向量，内容重复的切片只向量化一次
+        
+        依次从集合中已有的向量（重复上传、页眉页脚等样板文本）、本地向量缓存查找，
+        批次内重复的内容也只向量化一次。
+        集合中的向量是精确值，优先使用；本地缓存为 int8 量化后的近似值，
+        只用于集合中已不存在的内容（如文档删除后重新上传）。
+        
+        Args:
+            documents: 切片内容列表
+            hashes: 与 documents 对应的内容哈希列表
+            
+        Returns:
+            List[List[float]]: 与 documents 对应的向量列表
+        """
+        collection = self.collection
+        model_key = self._embedding_model_key
+        known: Dict[str, List[float]] = {}
+        
+        try:
+            existing = collection.get(
+                where={"content_hash": {"$in": list(set(hashes))}},
+                include=["embeddings", "metadatas"]
+            )
+            for embedding, metadata in zip(existing["embeddings"], existing["metadatas"]):
+                known.setdefault(metadata["content_hash"], embedding)
+        except Exception as e:
+            print(f"⚠ 查询已有向量失败: {e}")
+        
+        # 集合中没有的内容再查本地缓存
+        from_cache: Dict[str, List[float]] = {}
+        absent = {h for h in hashes if h not in known}
+        if absent and settings.EMBEDDING_CACHE_ENABLED:
+            try:
+                from_cache = embedding_cache.get_many(model_key, absent)
+                known.update(from_cache)
+            except Exception as e:
+                print(f"⚠ 读取向量缓存失败: {e}")
+        
+        missing = {}
+        for content_hash, content in zip(hashes, documents):
+            if content_hash not in known:
+                missing.setdefault(content_hash, content)
+        if missing:
+            embeddings = self._embed_texts(list(missing.values()))
+            known.update(zip(missing.keys(), embeddings))
+        
+        # 精确向量（集合中已有的及新计算的）写入本地缓存，缓存命中的近似值不回写
+        if settings.EMBEDDING_CACHE_ENABLED:
+            try:
+                embedding_cache.put_many(
+                    model_key,
+                    ((h, embedding) for h, embedding in known.items() if h not in from_cache)
+                )
+            except Exception as e:
+                print(f"⚠ 写入向量缓存失败: {e}")
+        
+        return [
+            embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+            for embedding in (known[content_hash] for content_hash in hashes)
+        ]
+    
+    def _map_bounded(self, fn, items) -> Iterator:
+        """
+        在嵌入线程池中并发执行 fn，按输入顺序产出结果
+        
+        最多只有 EMBED_CONCURRENCY 个任务的结果尚未被消费，避免向量全部堆积在内存中。
+        
+        Args:
+            fn: 任务函数
+            items: 任务参数序列
+            
+        Returns:
+            Iterator: 按顺序产出的结果
+        """
+        executor = self._get_embed_executor()
+        window = max(1, settings.EMBED_CONCURRENCY)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+    
     def add_documents(
         self, 
         doc_id: int, 
-        chunks: List[dict]
+        chunks: List[dict],
+        start_index: int = 0
     ) -> int:
         """
         添加文档切片到向量数据库
@@ -145,6 +363,7 @@ class VectorService:
         Args:
             doc_id: 文档ID
             chunks: 切片列表，每个切片包含 content 和 metadata
+            start_index: 第一个切片在文档中的序号（分批添加时使用）
             
         Returns:
             int: 成功添加的切片数量
@@ -153,74 +372,202 @@ class VectorService:
             return 0
         
         # 准备数据
-        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
+        id_prefix = f"{doc_id}_"
+        ids = [id_prefix + str(i) for i in range(start_index, start_index + len(chunks))]
         documents = [chunk["content"] for chunk in chunks]
+        hashes = [self._content_hash(content) for content in documents]
         metadatas = [
             {
                 "doc_id": doc_id,
                 "page": chunk["metadata"].get("page", 1),
-                "chunk_index": i
+                "chunk_index": i,
+                "content_hash": content_hash
             }
-            for i, chunk in enumerate(chunks)
+            for i, (chunk, content_hash) in enumerate(zip(chunks, hashes), start=start_index)
         ]
         
-        # 添加到集合
-        # ChromaDB 会自动使用默认的嵌入模型进行向量化
-        self.collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+        # 按固定大小分批写入集合，避免单次事务过大及内存峰值
+        # 内容相同的切片复用已有向量，只对新内容调用嵌入模型
+        collection = self.collection
+        batch_size = max(1, settings.CHROMA_ADD_BATCH_SIZE)
+        starts = range(0, len(chunks), batch_size)
+        if len(starts) == 1:
+            batch_embeddings = iter([self._embed_deduplicated(documents, hashes)])
+        else:
+            # 多个批次的向量并发计算（最多 EMBED_CONCURRENCY 个请求同时进行），写入仍按顺序串行
+            batch_embeddings = self._map_bounded(
+                lambda i: self._embed_deduplicated(documents[i:i + batch_size], hashes[i:i + batch_size]),
+                starts
+            )
+        
+        for i, embeddings in zip(starts, batch_embeddings):
+            collection.add(
+                ids=ids[i:i + batch_size],
+                documents=documents[i:i + batch_size],
+                metadatas=metadatas[i:i + batch_size],
+                embeddings=embeddings
+            )
+        self._invalidate_search_cache()
         
         return len(chunks)
     
     def search(
         self, 
         query: str, 
-        doc_id: Optional[int] = None,
-        top_k: Optional[int] = None
+        doc_id: Optional[Union[int, List[int]]] = None,
+        top_k: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        include: Optional[List[str]] = None
     ) -> List[dict]:
         """
         语义搜索相关文档片段
         
         Args:
             query: 查询文本
-            doc_id: 限定搜索的文档ID（可选）
+            doc_id: 限定搜索的文档ID或文档ID列表（可选）
             top_k: 返回的结果数量
+            query_embedding: 预先计算好的查询向量（可选，避免重复向量化）
+            include: 需要返回的字段，默认 documents/metadatas/distances；
+                只需排序信息时可省略 documents，避免传输切片内容
+            
+        Returns:
+            List[dict]: 搜索结果列表，包含 chunk_id, content, page, score 等信息
+        """
+        top_k = top_k or settings.TOP_K_RESULTS
+        include = include or self.DEFAULT_QUERY_INCLUDE
+        doc_key = tuple(sorted(set(doc_id))) if isinstance(doc_id, list) else doc_id
+        cache_key = (query, doc_key, top_k, tuple(include))
+        with self._cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._search_cache.move_to_end(cache_key)
+                return list(cached[1])
+        
+        search_results = self.search_batch(
+            [query],
+            doc_id,
+            top_k,
+            [query_embedding] if query_embedding is not None else None,
+            include
+        )[0]
+        
+        with self._cache_lock:
+            self._search_cache[cache_key] = (time.monotonic() + self.SEARCH_CACHE_TTL, search_results)
+            self._search_cache.move_to_end(cache_key)
+            if len(self._search_cache) > self.QUERY_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return list(search_results)
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        doc_id: Optional[Union[int, List[int]]] = None,
+        top_k: Optional[int] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        include: Optional[List[str]] = None
+    ) -> List[List[dict]]:
+        """
+        批量语义搜索，多个查询合并为一次 ChromaDB 查询（查询向量也一次批量计算）
+        
+        Args:
+            queries: 查询文本列表
+            doc_id: 限定搜索的文档ID或文档ID列表（可选）
+            top_k: 每个查询返回的结果数量
+            query_embeddings: 与 queries 对应的预先计算好的查询向量（可选）
+            include: 需要返回的字段，默认 documents/metadatas/distances
             
         Returns:
-            List[dict]: 搜索结果列表，包含 content, page, score 等信息
+            List[List[dict]]: 与 queries 对应的搜索结果列表
         """
+        if not queries:
+            return []
         top_k = top_k or settings.TOP_K_RESULTS
+        include = include or self.DEFAULT_QUERY_INCLUDE
         
         # 构建过滤条件
         where_filter = None
-        if doc_id is not None:
+        if isinstance(doc_id, list):
+            doc_ids = list(dict.fromkeys(doc_id))
+            if len(doc_ids) == 1:
+                where_filter = {"doc_id": doc_ids[0]}
+            elif doc_ids:
+                where_filter = {"doc_id": {"$in": doc_ids}}
+        elif doc_id is not None:
             where_filter = {"doc_id": doc_id}
         
         # 执行查询
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=top_k,
-            where=where_filter
-        )
+        collection = self.collection
+        if query_embeddings is not None:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k,
+                where=where_filter,
+                include=include
+            )
+        else:
+            results = collection.query(
+                query_texts=queries,
+                n_results=top_k,
+                where=where_filter,
+                include=include
+            )
         
         # 格式化结果
-        search_results = []
-        if results and results["documents"] and results["documents"][0]:
-            documents = results["documents"][0]
-            metadatas = results["metadatas"][0] if results["metadatas"] else [{}] * len(documents)
-            distances = results["distances"][0] if results["distances"] else [0] * len(documents)
+        if not results or not results["ids"]:
+            return [[] for _ in queries]
+        
+        return [
+            self._format_results(
+                ids,
+                results["documents"][i] if results.get("documents") else None,
+                results["metadatas"][i] if results.get("metadatas") else None,
+                results["distances"][i] if results.get("distances") else None
+            )
+            for i, ids in enumerate(results["ids"])
+        ]
+    
+    @staticmethod
+    def _format_results(
+        ids: List[str],
+        documents: Optional[List[str]],
+        metadatas: Optional[List[dict]],
+        distances: Optional[List[float]]
+    ) -> List[dict]:
+        """
+        将单个查询的检索结果格式化为字典列表
+        
+        Args:
+            ids: 切片ID列表
+            documents: 切片内容列表（未请求时为 None）
+            metadatas: 切片元数据列表（未请求时为 None）
+            distances: 余弦距离列表（未请求时为 None）
             
-            for doc, meta, dist in zip(documents, metadatas, distances):
-                search_results.append({
-                    "content": doc,
-                    "page": meta.get("page", 1),
-                    "doc_id": meta.get("doc_id"),
-                    "score": 1 - dist  # 将距离转换为相似度分数
-                })
-        
-        return search_results
+        Returns:
+            List[dict]: 搜索结果列表
+        """
+        if not ids:
+            return []
+        
+        if documents is None:
+            documents = [None] * len(ids)
+        if metadatas is None:
+            metadatas = [{}] * len(ids)
+        # 将距离整体转换为相似度分数
+        if distances is not None:
+            scores = (1.0 - np.asarray(distances, dtype=np.float64)).tolist()
+        else:
+            scores = [1.0] * len(ids)
+        
+        return [
+            {
+                "chunk_id": chunk_id,
+                "content": doc,
+                "page": meta.get("page", 1),
+                "doc_id": meta.get("doc_id"),
+                "score": score
+            }
+            for chunk_id, doc, meta, score in zip(ids, documents, metadatas, scores)
+        ]
     
     def delete_document_vectors(self, doc_id: int) -> bool:
         """
@@ -233,13 +580,16 @@ class VectorService:
             bool: 是否删除成功
         """
         try:
-            # 获取该文档的所有切片ID
-            results = self.collection.get(
-                where={"doc_id": doc_id}
+            collection = self.collection
+            # 获取该文档的所有切片ID（只取 ID，不读取内容和元数据）
+            results = collection.get(
+                where={"doc_id": doc_id},
+                include=[]
             )
             
             if results and results["ids"]:
-                self.collection.delete(ids=results["ids"])
+                collection.delete(ids=results["ids"])
+                self._invalidate_search_cache()
             
             return True
         except Exception:
@@ -269,55 +619,31 @@ class VectorService:
             Optional[str]: 第一页内容，如果没找到返回 None
         """
         try:
-            # 查询该文档第一页的chunks
+            # 第一页的切片（若有）总是序号最小的那些，一次查询取出文档最前面的切片，
+            # 在本地区分是否有第一页标记，无需先按页码查询再回退查询
             results = self.collection.get(
                 where={"$and": [
                     {"doc_id": doc_id},
-                    {"page": 1}
+                    {"chunk_index": {"$lt": self.FIRST_PAGE_SCAN_CHUNKS}}
                 ]},
                 include=["documents", "metadatas"]
             )
             
             if not results or not results["documents"]:
-                # 如果没有第一页标记，尝试获取 chunk_index 最小的
-                results = self.collection.get(
-                    where={"doc_id": doc_id},
-                    include=["documents", "metadatas"]
-                )
-                
-                if not results or not results["documents"]:
-                    return None
-                
-                # 按 chunk_index 排序，取最前面的
-                items = list(zip(results["documents"], results["metadatas"]))
-                items.sort(key=lambda x: x[1].get("chunk_index", 0))
-                
-                # 取前几个 chunks 直到达到字符限制
-                content_parts = []
-                total_chars = 0
-                for doc, _ in items:
-                    if total_chars + len(doc) > max_chars:
-                        break
-                    content_parts.append(doc)
-                    total_chars += len(doc)
-                
-                return "\n".join(content_parts) if content_parts else None
-            
-            # 合并第一页的所有 chunks
-            content_parts = []
-            total_chars = 0
+                return None
             
             # 按 chunk_index 排序
-            items = list(zip(results["documents"], results["metadatas"]))
-            items.sort(key=lambda x: x[1].get("chunk_index", 0))
+            items = sorted(
+                zip(results["documents"], results["metadatas"]),
+                key=lambda x: x[1].get("chunk_index", 0)
+            )
             
-            for doc, _ in items:
-                if total_chars + len(doc) > max_chars:
-                    break
-                content_parts.append(doc)
-                total_chars += len(doc)
+            # 优先合并第一页的 chunks，没有第一页标记时取最前面的 chunks
+            docs = [doc for doc, meta in items if meta.get("page") == 1] or [doc for doc, _ in items]
             
-            return "\n".join(content_parts) if content_parts else None
+            # 取前几个 chunks 直到达到字符限制
+            count = bisect_right(list(accumulate(map(len, docs))), max_chars)
+            return "\n".join(docs[:count]) if count else None
             
         except Exception as e:
             print(f"获取第一页内容失败: {e}")
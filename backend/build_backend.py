@@ -44,6 +44,15 @@ def get_target_triple():
     
     raise RuntimeError(f"不支持的平台: {system}-{machine}")
 
+def get_upx_dir():
+    """获取 UPX 所在目录，优先使用 UPX_DIR 环境变量"""
+    upx_dir = os.environ.get("UPX_DIR")
+    if upx_dir:
+        return upx_dir
+    
+    upx_path = shutil.which("upx")
+    return str(Path(upx_path).parent) if upx_path else None
+
 def main():
     print("=" * 50)
     print("Document Q&A 后端打包脚本")
@@ -61,12 +70,21 @@ def main():
     
     # 运行 PyInstaller
     print("\n正在打包后端服务...")
-    result = subprocess.run([
+    pyinstaller_args = [
         sys.executable, "-m", "PyInstaller",
         "--clean",
         "--noconfirm",
-        "backend.spec"
-    ], capture_output=False)
+    ]
+    
+    # 找到 UPX 时用其压缩可执行文件，减小打包体积
+    upx_dir = get_upx_dir()
+    if upx_dir:
+        print(f"使用 UPX 压缩: {upx_dir}")
+        pyinstaller_args += ["--upx-dir", upx_dir]
+    else:
+        print("未找到 UPX，跳过压缩（可通过 UPX_DIR 环境变量指定）")
+    
+    result = subprocess.run(pyinstaller_args + ["backend.spec"], capture_output=False)
     
     if result.returncode != 0:
         print("打包失败!")
@@ -0,0 +1,94 @@
+"""
+向量服务测试
+
+使用内存中的假集合和嵌入函数，验证上传流水线的批次在 add_documents 中
+拆成多个写入批次并发向量化，且按顺序写入。
+
+运行: python -m unittest discover -s tests（在 backend 目录下）
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from app.core.config import settings
+from app.services import DocumentService, VectorService
+
+
+class FakeCollection:
+    """只记录写入调用的假集合"""
+    
+    def __init__(self):
+        self.added = []
+    
+    def add(self, ids, documents, metadatas, embeddings):
+        self.added.append((ids, documents, metadatas, embeddings))
+
+
+class AddDocumentsConcurrencyTest(unittest.TestCase):
+    """add_documents 的分批并发向量化"""
+    
+    # 每次模拟嵌入请求的耗时（秒）
+    EMBED_LATENCY = 0.05
+    
+    def setUp(self):
+        self.document_service = DocumentService()
+        self.vector_service = VectorService()
+        self.collection = FakeCollection()
+        self.vector_service._collection = self.collection
+        
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.vector_service._embed_deduplicated = self._fake_embed
+        
+        # 生成足以填满一个完整上传批次的 TXT 文件
+        stride = settings.CHUNK_SIZE - settings.CHUNK_OVERLAP
+        length = (self.document_service.pipeline_batch_size() + 8) * stride
+        fd, self.filepath = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(("测试文本内容。" * (length // 7 + 1))[:length])
+    
+    def tearDown(self):
+        os.remove(self.filepath)
+        if self.vector_service._embed_executor is not None:
+            self.vector_service._embed_executor.shutdown(wait=True)
+    
+    def _fake_embed(self, texts, hashes):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.EMBED_LATENCY)
+            return [[float(len(text)), 1.0] for text in texts]
+        finally:
+            with self.lock:
+                self.active -= 1
+    
+    def test_upload_batch_is_split_and_embedded_concurrently(self):
+        batches, _ = self.document_service.iter_chunk_batches(self.filepath)
+        batch = next(batches)
+        batches.close()
+        
+        add_batch_size = settings.CHROMA_ADD_BATCH_SIZE
+        self.assertEqual(len(batch), self.document_service.pipeline_batch_size())
+        self.assertGreater(len(batch), add_batch_size)
+        
+        added = self.vector_service.add_documents(7, batch)
+        
+        self.assertEqual(added, len(batch))
+        self.assertEqual(len(self.collection.added), -(-len(batch) // add_batch_size))
+        self.assertGreater(self.max_active, 1)
+        self.assertLessEqual(self.max_active, settings.EMBED_CONCURRENCY)
+        
+        # 写入按切片顺序进行，每批不超过 CHROMA_ADD_BATCH_SIZE
+        ids = [chunk_id for call in self.collection.added for chunk_id in call[0]]
+        self.assertEqual(ids, [f"7_{i}" for i in range(len(batch))])
+        for ids_, documents, _, embeddings in self.collection.added:
+            self.assertLessEqual(len(ids_), add_batch_size)
+            self.assertEqual(embeddings, [[float(len(text)), 1.0] for text in documents])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -242,11 +242,15 @@ function processSSELine(
           onChunk(parsed.content)
           return
         }
-        if (parsed.type === 'sources' && Array.isArray(parsed.sources)) {
-          // 来源信息
+        if ((parsed.type === 'sources' || parsed.type === 'sources_update') && Array.isArray(parsed.sources)) {
+          // 来源信息（sources_update 为补充了文档名称的来源）
           onSources?.(parsed.sources)
           return
         }
+        if (parsed.type === 'status') {
+          // 处理阶段状态，仅用于保持连接
+          return
+        }
         if (parsed.type === 'done') {
           // 完成标记，提取 token 用量
           onComplete?.(parsed.usage)